@@ -0,0 +1,52 @@
+"""Асинхронные варианты CRUD-функций для async-обработчиков (AsyncSession + asyncpg)"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from . import models
+from .crud import spend_gold_update
+from .item_effects import calculate_rewards, get_user_modifiers_async
+
+# --- User CRUD ---
+async def get_user_by_login(db: AsyncSession, login: str):
+    # class_info загружаем сразу: ленивая загрузка в AsyncSession недоступна
+    result = await db.execute(
+        select(models.User)
+        .options(selectinload(models.User.class_info))
+        .filter(models.User.login == login)
+    )
+    return result.scalars().first()
+
+async def spend_user_gold(db: AsyncSession, user_id: int, amount: int):
+    """Списать золото, если его хватает; остаток или None. Коммит - у вызывающего кода"""
+    row = (await db.execute(spend_gold_update(user_id, amount))).first()
+    return row.gold if row is not None else None
+
+async def get_purchase_cost(db: AsyncSession, user_id: int, class_id, price: int) -> int:
+    gold_change, _ = calculate_rewards(class_id, await get_user_modifiers_async(db, user_id), -price)
+    return -gold_change
+
+# --- Item CRUD ---
+async def get_item(db: AsyncSession, item_id: int):
+    result = await db.execute(select(models.Item).filter(models.Item.item_id == item_id))
+    return result.scalars().first()
+
+# --- UserItem (Inventory) CRUD ---
+async def get_user_item(db: AsyncSession, user_id: int, item_id: int):
+    result = await db.execute(
+        select(models.UserItem).filter(
+            models.UserItem.user_id == user_id,
+            models.UserItem.item_id == item_id
+        )
+    )
+    return result.scalars().first()
+
+async def add_item_to_user_inventory(db: AsyncSession, user_id: int, item_id: int):
+    # Check if user already has this item
+    existing_item = await get_user_item(db, user_id, item_id)
+    if existing_item:
+        return existing_item
+    
+    db_user_item = models.UserItem(user_id=user_id, item_id=item_id, active='false')
+    db.add(db_user_item)
+    await db.commit()
+    return db_user_item
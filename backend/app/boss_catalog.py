@@ -0,0 +1,144 @@
+"""Справочник боссов в памяти процесса.
+
+Таблица bosses - статические справочные данные (init_bosses.py), поэтому она
+загружается один раз в неизменяемый BossCatalog. Босс для команды выбирается
+по Boss.min_team_level бинарным поиском, без запросов к БД; новый уровень
+сложности - это просто новая строка с min_team_level.
+
+Каталог перезагружается при смене версии: invalidate_boss_catalog() вызывается
+вместе со сбросом справочника "bosses" в reference_cache - после изменения
+боссов на этом воркере и по событию из broadcast на остальных. Пропущенное
+событие не оставляет каталог устаревшим навсегда: он перечитывается по
+BOSS_CATALOG_TTL и при обращении к неизвестному boss_id (find_boss). Пустой
+каталог (таблица еще не заполнена) не кэшируется.
+"""
+from bisect import bisect_right
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+from .reference_cache import reference_cache
+
+BOSS_CATALOG_TTL = float(os.getenv("BOSS_CATALOG_TTL", "300"))
+# Не чаще раза в это время каталог перечитывается из-за неизвестного boss_id
+BOSS_CATALOG_MISS_RELOAD_INTERVAL = float(os.getenv("BOSS_CATALOG_MISS_RELOAD_INTERVAL", "5"))
+
+
+class BossInfo(NamedTuple):
+    boss_id: int
+    name: str
+    base_lives: int
+    information: Optional[str]
+    level: int
+    gold_reward: int
+    img_url: Optional[str]
+    min_team_level: Optional[int]
+
+
+class BossCatalog:
+    """Неизменяемый снимок таблицы bosses с индексом уровней сложности"""
+
+    def __init__(self, bosses, version: int = 0):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self._bosses = MappingProxyType({boss.boss_id: boss for boss in bosses})
+        # Уровни сложности: по возрастанию min_team_level, при равенстве - меньший boss_id
+        tiers = {}
+        for boss in sorted(bosses, key=lambda boss: (boss.min_team_level or 0, boss.boss_id)):
+            if boss.min_team_level is not None:
+                tiers.setdefault(boss.min_team_level, boss)
+        self._tier_levels = tuple(tiers)
+        self._tier_bosses = tuple(tiers.values())
+
+    def __len__(self):
+        return len(self._bosses)
+
+    def get(self, boss_id) -> Optional[BossInfo]:
+        return self._bosses.get(boss_id)
+
+    def all(self):
+        return list(self._bosses.values())
+
+    def for_level(self, avg_level: float) -> Optional[BossInfo]:
+        """Босс для среднего уровня команды: последний уровень сложности с min_team_level <= avg_level"""
+        if not self._tier_bosses:
+            return None
+        index = bisect_right(self._tier_levels, avg_level) - 1
+        return self._tier_bosses[max(index, 0)]
+
+
+def load_boss_catalog(db: Session, version: int = 0) -> BossCatalog:
+    rows = db.query(models.Boss).all()
+    return BossCatalog(
+        [
+            BossInfo(
+                boss_id=row.boss_id, name=row.name, base_lives=row.base_lives,
+                information=row.information, level=row.level, gold_reward=row.gold_reward,
+                img_url=row.img_url, min_team_level=row.min_team_level
+            )
+            for row in rows
+        ],
+        version=version
+    )
+
+
+_catalog: Optional[BossCatalog] = None
+_version = 0
+_lock = threading.Lock()
+
+
+def _is_fresh(catalog: Optional[BossCatalog], max_age: float) -> bool:
+    return (
+        catalog is not None and catalog.version == _version
+        and time.monotonic() - catalog.loaded_at < max_age
+    )
+
+
+def get_boss_catalog() -> BossCatalog:
+    """Текущий каталог; загружается при первом обращении, после смены версии и по TTL"""
+    catalog = _catalog
+    if _is_fresh(catalog, BOSS_CATALOG_TTL):
+        return catalog
+    return reload_boss_catalog()
+
+
+def reload_boss_catalog(max_age: float = None) -> BossCatalog:
+    """Перечитать таблицу bosses, если каталог устарел или загружен раньше max_age секунд назад"""
+    global _catalog
+    with _lock:
+        if _is_fresh(_catalog, BOSS_CATALOG_TTL if max_age is None else max_age):
+            return _catalog
+        db = SessionLocal()
+        try:
+            catalog = load_boss_catalog(db, _version)
+        finally:
+            db.close()
+        # Пустой каталог не запоминаем: следующее обращение снова прочитает таблицу
+        if len(catalog):
+            _catalog = catalog
+        return catalog
+
+
+def find_boss(boss_id) -> Optional[BossInfo]:
+    """Босс по id; при промахе каталог перечитывается (не чаще BOSS_CATALOG_MISS_RELOAD_INTERVAL)"""
+    boss = get_boss_catalog().get(boss_id)
+    if boss is None and boss_id is not None:
+        boss = reload_boss_catalog(BOSS_CATALOG_MISS_RELOAD_INTERVAL).get(boss_id)
+    return boss
+
+
+def invalidate_boss_catalog():
+    """Поднять версию: следующее обращение перечитает таблицу bosses"""
+    global _version
+    with _lock:
+        _version += 1
+
+
+# Изменение справочника боссов сбрасывает и каталог
+reference_cache.on_invalidate("bosses", invalidate_boss_catalog)
@@ -0,0 +1,205 @@
+"""Рассылка событий команд между воркерами uvicorn.
+
+Каждый воркер держит свои WebSocket-соединения, поэтому события (сообщения
+чата, здоровье босса) публикуются через общий бэкенд и доставляются всеми
+воркерами своим подключенным клиентам.
+
+Бэкенды выбираются переменной BROADCAST_BACKEND:
+  memory   - в пределах одного процесса (по умолчанию, для тестов и одного воркера)
+  postgres - Postgres LISTEN/NOTIFY, отдельный сервис не нужен
+"""
+from typing import Awaitable, Callable
+import asyncio
+import json
+import os
+
+from .database import DATABASE_URL
+
+BROADCAST_CHANNEL = os.getenv("BROADCAST_CHANNEL", "gamify_team_events")
+# Ограничение NOTIFY в Postgres - 8000 байт
+MAX_NOTIFY_PAYLOAD = 7900
+# Проверка соединения LISTEN и предельная задержка переподключения, секунды
+BROADCAST_HEALTH_INTERVAL = float(os.getenv("BROADCAST_HEALTH_INTERVAL", "30"))
+BROADCAST_MAX_RECONNECT_DELAY = float(os.getenv("BROADCAST_MAX_RECONNECT_DELAY", "30"))
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class MemoryBroadcast:
+    """Доставка событий внутри одного процесса"""
+
+    def __init__(self):
+        self._handler = None
+        self._loop = None
+
+    async def connect(self, handler: EventHandler):
+        self._handler = handler
+        self._loop = asyncio.get_running_loop()
+
+    async def disconnect(self):
+        self._handler = None
+
+    async def publish(self, event: dict):
+        if self._handler is not None:
+            await self._handler(event)
+
+    def publish_threadsafe(self, event: dict):
+        """Опубликовать событие из синхронного обработчика (поток threadpool)"""
+        if self._loop is not None and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self.publish(event), self._loop)
+
+
+def _encode(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False)
+
+
+def fit_notify_payload(event: dict, limit: int = MAX_NOTIFY_PAYLOAD):
+    """JSON события, не превышающий limit байт, или None.
+
+    Длинный текст сообщения чата обрезается (полный текст сохранен в БД),
+    событие помечается "truncated": true. Прочие события не обрезаются.
+    """
+    payload = _encode(event)
+    overflow = len(payload.encode("utf-8")) - limit
+    if overflow <= 0:
+        return payload
+    team_event = event.get("event")
+    if not isinstance(team_event, dict) or not isinstance(team_event.get("text"), str):
+        return None
+    text = team_event["text"].encode("utf-8")
+    while overflow > 0 and text:
+        # Экранирование в JSON только длиннее исходного текста, поэтому цикл сходится
+        text = text[:-overflow]
+        team_event = {**team_event, "text": text.decode("utf-8", errors="ignore"), "truncated": True}
+        payload = _encode({**event, "event": team_event})
+        overflow = len(payload.encode("utf-8")) - limit
+    return payload if overflow <= 0 else None
+
+
+class PostgresBroadcast(MemoryBroadcast):
+    """Доставка событий между воркерами через Postgres LISTEN/NOTIFY.
+
+    Соединение LISTEN проверяется каждые health_interval секунд; при обрыве
+    оно переоткрывается с экспоненциальной задержкой. Пока соединения нет,
+    события доставляются только клиентам этого воркера.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        channel: str = BROADCAST_CHANNEL,
+        health_interval: float = BROADCAST_HEALTH_INTERVAL,
+        max_reconnect_delay: float = BROADCAST_MAX_RECONNECT_DELAY
+    ):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self.health_interval = health_interval
+        self.max_reconnect_delay = max_reconnect_delay
+        self._connection = None
+        self._lost = None
+        self._watch_task = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        import asyncpg
+
+        return await asyncpg.connect(self.dsn)
+
+    async def _open(self):
+        connection = await self._connect()
+        lost = asyncio.Event()
+        connection.add_termination_listener(lambda _connection: lost.set())
+        await connection.add_listener(self.channel, self._on_notify)
+        self._connection, self._lost = connection, lost
+
+    async def _close(self):
+        connection, self._connection = self._connection, None
+        if connection is None or connection.is_closed():
+            return
+        try:
+            await connection.remove_listener(self.channel, self._on_notify)
+            await connection.close()
+        except Exception:
+            connection.terminate()
+
+    async def connect(self, handler: EventHandler):
+        await super().connect(handler)
+        await self._open()
+        self._watch_task = asyncio.create_task(self._watch())
+
+    async def disconnect(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        await self._close()
+        await super().disconnect()
+
+    async def _watch(self):
+        """Следить за соединением LISTEN и переподключаться при обрыве"""
+        while True:
+            if self._connection is not None:
+                try:
+                    await asyncio.wait_for(self._lost.wait(), self.health_interval)
+                except asyncio.TimeoutError:
+                    # Обрыв без закрытия сокета termination listener не замечает
+                    try:
+                        async with self._lock:
+                            await self._connection.execute("SELECT 1")
+                        continue
+                    except Exception as e:
+                        print(f"Broadcast LISTEN connection check failed: {e}")
+                print("Broadcast LISTEN connection lost, reconnecting")
+                await self._close()
+            
+            delay = 1.0
+            while self._connection is None:
+                await asyncio.sleep(delay)
+                try:
+                    await self._open()
+                    print("Broadcast LISTEN connection restored")
+                except Exception as e:
+                    delay = min(delay * 2, self.max_reconnect_delay)
+                    print(f"Broadcast reconnect failed: {e}; next attempt in {delay:.0f}s")
+
+    def _on_notify(self, connection, pid, channel, payload):
+        if self._handler is not None:
+            asyncio.ensure_future(self._handler(json.loads(payload)))
+
+    async def publish(self, event: dict):
+        payload = fit_notify_payload(event)
+        if payload is None:
+            print(
+                f"ERROR: broadcast event exceeds {MAX_NOTIFY_PAYLOAD} bytes and was dropped: "
+                f"{_encode(event)[:200]}"
+            )
+            return
+        if self._connection is None:
+            # Соединение восстанавливается в _watch: доставляем хотя бы своим клиентам
+            print("Broadcast connection unavailable, event delivered locally only")
+            await super().publish(json.loads(payload))
+            return
+        try:
+            async with self._lock:
+                await self._connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+        except Exception as e:
+            print(f"Broadcast NOTIFY failed, event delivered locally only: {e}")
+            if self._lost is not None:
+                self._lost.set()
+            await super().publish(json.loads(payload))
+
+
+def create_broadcast():
+    backend = os.getenv("BROADCAST_BACKEND", "memory").lower()
+    if backend == "postgres":
+        # asyncpg принимает DSN без указания драйвера SQLAlchemy
+        dsn = os.getenv("BROADCAST_DATABASE_URL", DATABASE_URL.replace("postgresql+psycopg2://", "postgresql://", 1))
+        return PostgresBroadcast(dsn)
+    return MemoryBroadcast()
+
+
+broadcast = create_broadcast()
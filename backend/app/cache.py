@@ -0,0 +1,151 @@
+"""Кэши уровня процесса: LRU с TTL в памяти и опциональный Redis-совместимый бэкенд"""
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+
+from . import models
+
+
+class TTLCache:
+    """LRU-кэш в памяти процесса с ограниченным временем жизни записей"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache:
+    """Кэш в Redis-совместимом хранилище; значения хранятся в JSON"""
+
+    def __init__(self, url: str, ttl: float = 30.0, prefix: str = "gamify:"):
+        import redis  # опциональная зависимость
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05)
+        self._errors = (redis.RedisError, OSError)
+
+    # Недоступность Redis не должна ломать запросы: промах кэша - это чтение из БД
+    def get(self, key):
+        try:
+            raw = self._client.get(self.prefix + str(key))
+        except self._errors as e:
+            print(f"Redis cache get failed: {e}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        try:
+            self._client.set(self.prefix + str(key), json.dumps(value), px=int(self.ttl * 1000))
+        except self._errors as e:
+            print(f"Redis cache set failed: {e}")
+
+    def delete(self, key):
+        try:
+            self._client.delete(self.prefix + str(key))
+        except self._errors as e:
+            print(f"Redis cache delete failed, key {key} stays until TTL: {e}")
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + "*"):
+            self._client.delete(key)
+
+
+class InvalidatedCache:
+    """Обертка кэша: удаление ключа передается подписчикам (другим воркерам через broadcast)"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        # Подписчики вызываются с ключом после удаления на этом воркере
+        self.invalidation_listeners = []
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+    def delete(self, key):
+        self.cache.delete(key)
+        for listener in self.invalidation_listeners:
+            listener(key)
+
+    def delete_local(self, key):
+        """Удаление по событию от другого воркера, без повторной рассылки"""
+        self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+def _build_identity_cache():
+    ttl = float(os.getenv("IDENTITY_CACHE_TTL", "30"))
+    redis_url = os.getenv("IDENTITY_CACHE_REDIS_URL")
+    if redis_url:
+        try:
+            return RedisCache(redis_url, ttl=ttl, prefix="gamify:identity:")
+        except ImportError:
+            print("IDENTITY_CACHE_REDIS_URL задан, но пакет redis не установлен; используется кэш в памяти")
+    return TTLCache(maxsize=int(os.getenv("IDENTITY_CACHE_SIZE", "2048")), ttl=ttl)
+
+
+# Кэш аутентифицированных пользователей, ключ - login (subject токена).
+# У каждого воркера своя копия, поэтому удаления рассылаются остальным.
+identity_cache = InvalidatedCache(_build_identity_cache())
+
+_USER_CACHE_FIELDS = [
+    column.key for column in models.User.__table__.columns if column.key != "hashed_password"
+]
+
+
+def user_to_cache(user: models.User) -> dict:
+    """Снимок пользователя (без пароля) для хранения в кэше"""
+    data = {field: getattr(user, field) for field in _USER_CACHE_FIELDS}
+    class_info = user.class_info
+    data["class_info"] = None if class_info is None else {
+        "class_id": class_info.class_id,
+        "name": class_info.name,
+        "information": class_info.information,
+    }
+    return data
+
+
+def user_from_cache(data: dict) -> models.User:
+    """Восстановить несвязанный с сессией объект пользователя из снимка"""
+    fields = dict(data)
+    class_info = fields.pop("class_info", None)
+    user = models.User(**fields)
+    if class_info is not None:
+        user.class_info = models.Class(**class_info)
+    return user
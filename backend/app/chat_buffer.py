@@ -0,0 +1,88 @@
+"""Отложенная пакетная запись сообщений чата.
+
+Сообщения из WebSocket сразу рассылаются участникам, а в БД попадают
+пачками: один многострочный INSERT раз в CHAT_FLUSH_INTERVAL_MS миллисекунд
+или при накоплении CHAT_FLUSH_BATCH_SIZE сообщений. При остановке
+приложения буфер сбрасывается полностью.
+"""
+from datetime import datetime
+import asyncio
+import os
+
+from sqlalchemy import insert
+
+from . import models
+from .database import AsyncSessionLocal
+
+CHAT_FLUSH_INTERVAL_MS = int(os.getenv("CHAT_FLUSH_INTERVAL_MS", "200"))
+CHAT_FLUSH_BATCH_SIZE = int(os.getenv("CHAT_FLUSH_BATCH_SIZE", "100"))
+# Предел несохраненных сообщений, если БД временно недоступна
+CHAT_BUFFER_MAX_PENDING = int(os.getenv("CHAT_BUFFER_MAX_PENDING", "10000"))
+
+
+class ChatWriteBuffer:
+    def __init__(self, interval_ms: int = CHAT_FLUSH_INTERVAL_MS, batch_size: int = CHAT_FLUSH_BATCH_SIZE):
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self._pending = []
+        self._wakeup = None
+        self._stopping = False
+        self._task = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую запись и сохранить все накопленные сообщения"""
+        if self._task is not None:
+            # Без cancel(): начатый flush завершается, а не прерывается на середине
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        while self._pending:
+            if not await self.flush():
+                break
+
+    def add(self, team_id: int, user_id: int, message: str):
+        self._pending.append({
+            "team_id": team_id,
+            "user_id": user_id,
+            "message": message,
+            "timestamp": datetime.utcnow(),
+        })
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Записать накопленные сообщения одним INSERT; False при ошибке БД"""
+        rows, self._pending = self._pending, []
+        if not rows:
+            return True
+        saved = False
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(models.ChatMessage).values(rows))
+                await db.commit()
+            saved = True
+        except Exception as e:
+            print(f"Error flushing chat messages: {e}")
+        finally:
+            # Возвращаем сообщения в очередь (в том числе при отмене задачи), не превышая предел
+            if not saved:
+                self._pending = (rows + self._pending)[-CHAT_BUFFER_MAX_PENDING:]
+        return saved
+
+
+chat_buffer = ChatWriteBuffer()
@@ -0,0 +1,174 @@
+"""Обслуживание таблицы chat_messages: месячные секции и архивация.
+
+Если таблица секционирована (migrations/optional/chat_messages_partitioning.sql),
+секции создаются заранее на несколько месяцев вперед, а устаревшие
+отсоединяются целиком и переименовываются в архивные таблицы - без DELETE.
+Строки, попавшие в секцию по умолчанию, переносятся в новую месячную секцию
+при ее создании, а устаревшие - в chat_messages_archive.
+На обычной таблице старые сообщения переносятся в chat_messages_archive
+пачками, чтобы не держать длинных блокировок.
+"""
+import re
+from datetime import date
+
+from sqlalchemy import text
+
+from .database import engine
+
+PARTITION_PREFIX = "chat_messages_y"
+ARCHIVE_TABLE = "chat_messages_archive"
+
+_PARTITION_NAME_RE = re.compile(r"^chat_messages_y(\d{4})m(\d{2})$")
+
+
+def _add_months(day: date, months: int) -> date:
+    """Первое число месяца, отстоящего от day на months месяцев"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month.year:04d}m{month.month:02d}"
+
+
+def is_partitioned(connection) -> bool:
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p"
+        " JOIN pg_class c ON c.oid = p.partrelid"
+        " WHERE c.relname = 'chat_messages')"
+    )).scalar()
+
+
+def _get_partitions(connection):
+    rows = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i"
+        " JOIN pg_class c ON c.oid = i.inhrelid"
+        " JOIN pg_class p ON p.oid = i.inhparent"
+        " WHERE p.relname = 'chat_messages'"
+    ))
+    return [row.relname for row in rows]
+
+
+def _get_default_partition(connection):
+    return connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i"
+        " JOIN pg_class c ON c.oid = i.inhrelid"
+        " JOIN pg_class p ON p.oid = i.inhparent"
+        " WHERE p.relname = 'chat_messages' AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'"
+    )).scalar()
+
+
+def _create_partition(connection, name: str, month: date, default_partition: str = None):
+    bounds = {"start": month, "end": _add_months(month, 1)}
+    has_default_rows = default_partition is not None and connection.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {default_partition}"
+        " WHERE timestamp >= :start AND timestamp < :end)"
+    ), bounds).scalar()
+    if not has_default_rows:
+        connection.execute(text(
+            f"CREATE TABLE {name} PARTITION OF chat_messages"
+            f" FOR VALUES FROM ('{bounds['start'].isoformat()}') TO ('{bounds['end'].isoformat()}')"
+        ))
+        return
+    
+    # CREATE ... PARTITION OF не пройдет, пока в секции по умолчанию есть строки
+    # этого месяца: переносим их в новую таблицу и присоединяем ее как секцию
+    connection.execute(text(
+        f"CREATE TABLE {name} (LIKE chat_messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    ))
+    moved = connection.execute(text(
+        f"WITH moved AS (DELETE FROM {default_partition}"
+        " WHERE timestamp >= :start AND timestamp < :end"
+        " RETURNING message_id, team_id, user_id, message, timestamp)"
+        f" INSERT INTO {name} (message_id, team_id, user_id, message, timestamp)"
+        " SELECT message_id, team_id, user_id, message, timestamp FROM moved"
+    ), bounds).rowcount
+    connection.execute(text(
+        f"ALTER TABLE chat_messages ATTACH PARTITION {name}"
+        f" FOR VALUES FROM ('{bounds['start'].isoformat()}') TO ('{bounds['end'].isoformat()}')"
+    ))
+    print(f"В секцию {name} перенесено сообщений из {default_partition}: {moved}")
+
+
+def create_monthly_partitions(months_ahead: int = 3, today: date = None):
+    """Создать секции с текущего месяца на months_ahead месяцев вперед"""
+    start = _add_months(today or date.today(), 0)
+    created = []
+    with engine.begin() as connection:
+        if not is_partitioned(connection):
+            print("chat_messages не секционирована, секции не нужны")
+            return created
+        existing = set(_get_partitions(connection))
+        default_partition = _get_default_partition(connection)
+        for offset in range(months_ahead + 1):
+            month = _add_months(start, offset)
+            name = partition_name(month)
+            if name in existing:
+                continue
+            _create_partition(connection, name, month, default_partition)
+            created.append(name)
+    return created
+
+
+def _archive_partitions(connection, cutoff: date):
+    """Отсоединить месячные секции целиком старше cutoff"""
+    archived = []
+    for name in sorted(_get_partitions(connection)):
+        match = _PARTITION_NAME_RE.match(name)
+        if not match:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if _add_months(month, 1) > cutoff:
+            continue
+        archive_name = name.replace(PARTITION_PREFIX, f"{ARCHIVE_TABLE}_y", 1)
+        connection.execute(text(f"ALTER TABLE chat_messages DETACH PARTITION {name}"))
+        connection.execute(text(f"ALTER TABLE {name} RENAME TO {archive_name}"))
+        archived.append(archive_name)
+    return archived
+
+
+def _archive_rows(cutoff: date, batch_size: int, source: str = "chat_messages"):
+    """Перенести сообщения старше cutoff из source в chat_messages_archive пачками"""
+    with engine.begin() as connection:
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (LIKE chat_messages INCLUDING DEFAULTS)"
+        ))
+
+    moved_total = 0
+    while True:
+        # Каждая пачка - отдельная короткая транзакция
+        with engine.begin() as connection:
+            moved = connection.execute(text(
+                "WITH moved AS ("
+                f" DELETE FROM {source} WHERE message_id IN ("
+                f"  SELECT message_id FROM {source} WHERE timestamp < :cutoff"
+                "  ORDER BY message_id LIMIT :batch_size FOR UPDATE SKIP LOCKED)"
+                " RETURNING message_id, team_id, user_id, message, timestamp)"
+                f" INSERT INTO {ARCHIVE_TABLE} (message_id, team_id, user_id, message, timestamp)"
+                " SELECT message_id, team_id, user_id, message, timestamp FROM moved"
+            ), {"cutoff": cutoff, "batch_size": batch_size}).rowcount
+        moved_total += moved
+        if moved < batch_size:
+            return moved_total
+
+
+def archive_old_messages(older_than_months: int = 6, batch_size: int = 5000, today: date = None):
+    """Убрать из chat_messages сообщения старше older_than_months месяцев.
+
+    Возвращает список отсоединенных секций или число перенесенных строк.
+    """
+    cutoff = _add_months(today or date.today(), -older_than_months)
+    with engine.begin() as connection:
+        partitioned = is_partitioned(connection)
+        if partitioned:
+            archived = _archive_partitions(connection, cutoff)
+            default_partition = _get_default_partition(connection)
+    if not partitioned:
+        return _archive_rows(cutoff, batch_size)
+    
+    # Старые строки из секции по умолчанию переносятся построчно
+    if default_partition is not None:
+        moved = _archive_rows(cutoff, batch_size, source=default_partition)
+        if moved:
+            print(f"Из {default_partition} перенесено в архив сообщений: {moved}")
+    return archived
@@ -1,11 +1,83 @@
+from sqlalchemy import and_, case, exists, func, or_, select, text, update
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 from . import models, schemas, security
+from .boss_catalog import find_boss, get_boss_catalog
+from .cache import identity_cache
+from .reference_cache import reference_cache
+from .item_effects import calculate_rewards, get_user_modifiers, get_users_modifiers, invalidate_user_modifiers
+from datetime import date
 import json
+import math
 import random # For boss attack simulation
 
+# --- Team events ---
+# Подписчики вызываются с (team_id, event) после фиксации изменений в БД
+team_event_listeners = []
+
+def emit_team_event(team_id: int, event: dict):
+    for listener in team_event_listeners:
+        listener(team_id, event)
+
+def emit_boss_state(team_id: int, boss_id, boss_lives: int):
+    emit_team_event(team_id, {"type": "boss_hp", "boss_id": boss_id, "boss_lives": boss_lives})
+
+def emit_boss_changed(team_id: int, boss, boss_lives: int):
+    """Новый босс команды (BossInfo или None) - клиенту не нужно перечитывать команду"""
+    emit_team_event(team_id, {
+        "type": "boss",
+        "boss_id": boss.boss_id if boss else None,
+        "boss": boss._asdict() if boss else None,
+        "boss_lives": boss_lives
+    })
+
+# --- Reference data events ---
+# Подписчики вызываются с видом справочника ("bosses", ...) после его изменения
+reference_data_listeners = []
+
+def emit_reference_invalidated(kind: str):
+    for listener in reference_data_listeners:
+        listener(kind)
+
+def emit_member_update(team_id: int, user_id: int, **fields):
+    """Изменившиеся поля участника команды (diff для клиентов)"""
+    if team_id:
+        emit_team_event(team_id, {"type": "member", "user_id": user_id, **fields})
+
+# --- Team stats ---
+def team_stats_update(team_id: int, members: int = 0, levels: int = 0):
+    """UPDATE счетчиков member_count/level_sum команды на заданные приращения"""
+    return (
+        update(models.Team)
+        .where(models.Team.team_id == team_id)
+        .values(
+            member_count=models.Team.member_count + members,
+            level_sum=models.Team.level_sum + levels
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def change_team_stats(db: Session, team_id: int, members: int = 0, levels: int = 0):
+    """Изменить счетчики команды в текущей транзакции (коммит - у вызывающего кода)"""
+    if team_id and (members or levels):
+        db.execute(team_stats_update(team_id, members, levels))
+
+def move_team_stats(db: Session, old_team_id, old_level: int, new_team_id, new_level: int):
+    """Учесть смену команды и/или уровня участника в счетчиках команд"""
+    if old_team_id == new_team_id:
+        change_team_stats(db, new_team_id, levels=new_level - old_level)
+    else:
+        change_team_stats(db, old_team_id, members=-1, levels=-old_level)
+        change_team_stats(db, new_team_id, members=1, levels=new_level)
+
 # --- User CRUD --- 
+def invalidate_user_cache(db: Session, user_id: int):
+    """Сбросить закэшированного пользователя после изменения его данных"""
+    db_user = db.get(models.User, user_id)
+    if db_user:
+        identity_cache.delete(db_user.login)
+
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.user_id == user_id).first()
 
@@ -37,77 +109,103 @@ def update_user_profile(db: Session, user_id: int, user_update: schemas.UserUpda
     if not db_user:
         return None
     
+    old_login = db_user.login
+    old_team_id, old_level = db_user.team_id, db_user.level
     update_data = user_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_user, key, value)
+    move_team_stats(db, old_team_id, old_level, db_user.team_id, db_user.level)
     
     db.commit()
     db.refresh(db_user)
+    identity_cache.delete(old_login)
+    identity_cache.delete(db_user.login)
     return db_user
 
+def calculate_level_up(level: int, points: int, max_points: int):
+    """Рассчитать повышение уровня без цикла.
+
+    Возвращает (level, points, max_points, levels_gained).
+    Для уровня L нужно max_points = 100 * L опыта.
+    """
+    if points < max_points:
+        return level, points, max_points, 0
+    
+    points -= max_points
+    level += 1
+    # Наибольшее k, при котором 100 * (k*L + k*(k-1)/2) <= points
+    b = 2 * level - 1
+    k = (math.isqrt(b * b + 8 * (points // 100)) - b) // 2
+    points -= 100 * (k * level + k * (k - 1) // 2)
+    level += k
+    return level, points, 100 * level, k + 1  # Формула опыта для уровней
+
+def apply_level_up(db_user):
+    """Повысить уровень, если опыт превысил max_points"""
+    level, points, max_points, levels_gained = calculate_level_up(
+        db_user.level, db_user.points, db_user.max_points
+    )
+    if levels_gained:
+        db_user.level = level
+        db_user.points = points
+        db_user.max_points = max_points
+        db_user.attack += levels_gained
+    return db_user
+
+def spend_gold_update(user_id: int, amount: int):
+    """UPDATE списания золота, который не срабатывает при нехватке (нельзя уйти в минус)"""
+    return (
+        update(models.User)
+        .where(models.User.user_id == user_id, models.User.gold >= amount)
+        .values(gold=models.User.gold - amount)
+        .returning(models.User.gold)
+        .execution_options(synchronize_session=False)
+    )
+
+def spend_user_gold(db: Session, user_id: int, amount: int):
+    """Списать золото по текущему значению в БД, а не по кэшу пользователя.
+
+    Возвращает остаток или None, если золота не хватает. Коммит - у вызывающего кода.
+    """
+    row = db.execute(spend_gold_update(user_id, amount)).first()
+    return row.gold if row is not None else None
+
+def get_purchase_cost(db: Session, user_id: int, class_id, price: int) -> int:
+    """Стоимость покупки с учетом класса и предметов (как прежнее списание через update_user_gold_xp)"""
+    gold_change, _ = calculate_rewards(class_id, get_user_modifiers(db, user_id), -price)
+    return -gold_change
+
 def update_user_gold_xp(db: Session, user_id: int, gold_change: int = 0, points_change: int = 0):
     db_user = get_user(db, user_id)
-    db_useritems = get_user_items(db, user_id)
-    id_user_items = [id_items.item_id for id_items in db_useritems] 
     if db_user:
-        
-        first_exp = points_change
-        first_gold = gold_change
-        experience_reward = points_change
-        gold_reward = gold_change
-        
-        
-        # Классовые мультипликаторы
-        if db_user.class_id == 2:
-            experience_reward = int(experience_reward * 1.1)
-        elif db_user.class_id == 3:
-            gold_reward = int(gold_reward * 1.1)
-        
-        # Мультипликаторы вещей
-        if 5 in id_user_items:
-            experience_reward += int(first_exp * 0.05)
-        if 7 in id_user_items:
-            gold_reward += int(first_gold * 0.05)
-        if 9 in id_user_items:
-            if random.random() < 0.2:
-                experience_reward *= 2
-        if 12 in id_user_items:
-            if random.random() < 0.2:
-                gold_reward *= 2
-        if 14 in id_user_items:
-            experience_reward += int(first_exp * 0.1)
-        
+        gold_reward, experience_reward = calculate_rewards(
+            db_user.class_id, get_user_modifiers(db, user_id), gold_change, points_change
+        )
         
         db_user.gold += gold_reward
         db_user.points += experience_reward
         
-        
-
-        
-        
         # Level up if points exceed max_points
-        while db_user.points >= db_user.max_points:
-            db_user.points -= db_user.max_points
-            db_user.level += 1
-            db_user.max_points = 100 * db_user.level  # Формула опыта для уровней
-            db_user.attack += 1
+        old_level = db_user.level
+        apply_level_up(db_user)
+        change_team_stats(db, db_user.team_id, levels=db_user.level - old_level)
             
         db.commit()
         db.refresh(db_user)
+        identity_cache.delete(db_user.login)
+        if db_user.level != old_level:
+            emit_member_update(db_user.team_id, db_user.user_id, level=db_user.level, attack=db_user.attack)
     return db_user
 
 def decrease_user_lives(db: Session, user_id: int, lives: int):
     user = get_user(db, user_id)
-    db_useritems = get_user_items(db, user_id)
-    id_user_items = [id_items.item_id for id_items in db_useritems]
+    modifiers = get_user_modifiers(db, user_id)
     
-    if 10 in id_user_items:
-        if random.random() < 0.2:
+    if modifiers.chains_protecting_chance:
+        if random.random() * 100 < modifiers.chains_protecting_chance:
             return user
     
-    lives = user.lives
-    if 13 in id_user_items:
-        lives += 1
+    lives = user.lives + modifiers.protecting_lives
     
     level = user.level
     max_points = user.max_points
@@ -121,6 +219,8 @@ def decrease_user_lives(db: Session, user_id: int, lives: int):
         attack = user.attack - 1 if user.attack > 1 else user.attack
         points = 0
         
+    level_changed = user.level != level
+    change_team_stats(db, user.team_id, levels=level - user.level)
     user.lives = lives
     user.level = level
     user.max_points = max_points
@@ -129,6 +229,9 @@ def decrease_user_lives(db: Session, user_id: int, lives: int):
     # Сохраняем изменения
     db.commit()
     db.refresh(user)
+    identity_cache.delete(user.login)
+    if level_changed:
+        emit_member_update(user.team_id, user.user_id, level=user.level, attack=user.attack)
 
     return user
 
@@ -144,6 +247,10 @@ def create_class(db: Session, class_data: schemas.ClassCreate):
     db.add(db_class)
     db.commit()
     db.refresh(db_class)
+    # Класс входит и в ответ /items (class_info)
+    for kind in ("classes", "items"):
+        reference_cache.invalidate(kind)
+        emit_reference_invalidated(kind)
     return db_class
 
 # --- Item CRUD ---
@@ -152,13 +259,17 @@ def create_item(db: Session, item: schemas.ItemCreate):
     db.add(db_item)
     db.commit()
     db.refresh(db_item)
+    reference_cache.invalidate("items")
+    emit_reference_invalidated("items")
     return db_item
 
 def get_item(db: Session, item_id: int):
     return db.query(models.Item).filter(models.Item.item_id == item_id).first()
 
 def get_items(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Item).offset(skip).limit(limit).all()
+    return db.query(models.Item).options(
+        joinedload(models.Item.class_info)
+    ).offset(skip).limit(limit).all()
 
 # --- UserItem (Inventory) CRUD ---
 def get_user_item(db: Session, user_id: int, item_id: int):
@@ -193,6 +304,14 @@ def get_active_items_count(db: Session, user_id: int):
 
 
 def update_user_item_active_status(db: Session, user_id: int, item_id: int, active: str):
+    try:
+        return _update_user_item_active_status(db, user_id, item_id, active)
+    finally:
+        # Предметы меняют жизни, уровень, атаку и модификаторы наград пользователя
+        invalidate_user_modifiers(user_id)
+        invalidate_user_cache(db, user_id)
+
+def _update_user_item_active_status(db: Session, user_id: int, item_id: int, active: str):
     db_user_item = get_user_item(db, user_id, item_id)
     db_user = get_user(db, user_id)
     if not db_user_item:
@@ -229,6 +348,7 @@ def update_user_item_active_status(db: Session, user_id: int, item_id: int, acti
                     db_user.level += 1
                     db_user.max_points = 100 * db_user.level  # Формула опыта для уровней
                     db_user.attack += 1
+                    change_team_stats(db, db_user.team_id, levels=1)
                 db_user.points = current_points
                 db.commit()
                 db.refresh(db_user)
@@ -239,6 +359,7 @@ def update_user_item_active_status(db: Session, user_id: int, item_id: int, acti
                 db_user.level += 1
                 db_user.max_points = 100 * db_user.level  # Формула опыта для уровней
                 db_user.attack += 1
+                change_team_stats(db, db_user.team_id, levels=1)
                 db.commit()
                 db.refresh(db_user)
                 remove_user_item(db, user_id, item_id)
@@ -302,6 +423,7 @@ def remove_user_item(db: Session, user_id: int, item_id: int):
     if db_user_item:
         db.delete(db_user_item)
         db.commit()
+        invalidate_user_modifiers(user_id)
     return db_user_item
 
 # --- Team CRUD ---
@@ -317,6 +439,59 @@ def get_team(db: Session, team_id: int):
         # Попробуем без joinedload в случае ошибки
         return db.query(models.Team).filter(models.Team.team_id == team_id).first()
 
+def get_team_view(db: Session, team_id: int):
+    """Команда с владельцем и участниками одним SQL-запросом (босс - из каталога).
+
+    Возвращает (team, member_count, average_level) или None; агрегаты берутся
+    из счетчиков member_count/level_sum команды.
+    """
+    team = db.query(models.Team).options(
+        joinedload(models.Team.owner),
+        joinedload(models.Team.members)
+    ).filter(models.Team.team_id == team_id).first()
+    if team is None:
+        return None
+    return team, team.member_count, get_team_average_level(team)
+
+def get_team_average_level(team: models.Team) -> float:
+    return team.level_sum / team.member_count if team.member_count else 0.0
+
+def check_team_stats(db: Session, fix: bool = False):
+    """Сверить счетчики команд с пользователями.
+
+    Возвращает список (team_id, member_count, level_sum, actual_count, actual_sum)
+    для расхождений; при fix=True счетчики перезаписываются фактическими.
+    """
+    actual = select(
+        models.User.team_id,
+        func.count(models.User.user_id).label("actual_count"),
+        func.coalesce(func.sum(models.User.level), 0).label("actual_sum")
+    ).where(models.User.team_id.isnot(None)).group_by(models.User.team_id).subquery()
+    actual_count = func.coalesce(actual.c.actual_count, 0)
+    actual_sum = func.coalesce(actual.c.actual_sum, 0)
+    
+    drift = db.execute(
+        select(
+            models.Team.team_id, models.Team.member_count, models.Team.level_sum,
+            actual_count.label("actual_count"), actual_sum.label("actual_sum")
+        )
+        .select_from(models.Team)
+        .outerjoin(actual, actual.c.team_id == models.Team.team_id)
+        .where(or_(models.Team.member_count != actual_count, models.Team.level_sum != actual_sum))
+        .order_by(models.Team.team_id)
+    ).all()
+    
+    if fix and drift:
+        for row in drift:
+            db.execute(
+                update(models.Team)
+                .where(models.Team.team_id == row.team_id)
+                .values(member_count=row.actual_count, level_sum=row.actual_sum)
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+    return drift
+
 def get_team_by_name(db: Session, team_name: str):
     return db.query(models.Team).filter(models.Team.name == team_name).first()
 
@@ -348,7 +523,9 @@ def create_team(db: Session, team: schemas.TeamCreate, owner_id: int):
     owner = get_user(db, owner_id)
     if owner:
         owner.team_id = db_team.team_id
+        change_team_stats(db, db_team.team_id, members=1, levels=owner.level)
         db.commit()
+        identity_cache.delete(owner.login)
     
     return db_team
 
@@ -368,6 +545,10 @@ def update_team(db: Session, team_id: int, team_update: schemas.TeamUpdate):
 def delete_team(db: Session, team_id: int):
     db_team = get_team(db, team_id)
     if db_team:
+        member_logins = [
+            row.login for row in db.query(models.User.login).filter(models.User.team_id == team_id)
+        ]
+        
         # Удаляем всех участников из команды
         db.query(models.User).filter(models.User.team_id == team_id).update({"team_id": None})
         
@@ -377,6 +558,8 @@ def delete_team(db: Session, team_id: int):
         # Удаляем команду
         db.delete(db_team)
         db.commit()
+        for login in member_logins:
+            identity_cache.delete(login)
     return db_team
 
 def add_member_to_team(db: Session, team_id: int, user_id: int):
@@ -391,12 +574,17 @@ def add_member_to_team(db: Session, team_id: int, user_id: int):
         return None  # Пользователь уже в команде
     
     user.team_id = team_id
+    change_team_stats(db, team_id, members=1, levels=user.level)
     db.commit()
+    identity_cache.delete(user.login)
     
     # Обновляем босса команды
     update_team_boss(db, team_id)
     
     db.refresh(user)
+    emit_member_update(
+        team_id, user.user_id, **schemas.UserSimple.model_validate(user).model_dump(exclude={"user_id"})
+    )
     return user
 
 def remove_member_from_team(db: Session, team_id: int, user_id: int, remover_id: int):
@@ -416,7 +604,29 @@ def remove_member_from_team(db: Session, team_id: int, user_id: int, remover_id:
         return None
     
     user.team_id = None
+    change_team_stats(db, team_id, members=-1, levels=-user.level)
+    db.commit()
+    identity_cache.delete(user.login)
+    emit_team_event(team_id, {"type": "member_left", "user_id": user_id})
+    
+    # Обновляем босса команды
+    update_team_boss(db, team_id)
+    
+    db.refresh(user)
+    return user
+
+def leave_team(db: Session, user_id: int):
+    """Участник сам выходит из своей команды"""
+    user = get_user(db, user_id)
+    if not user or user.team_id is None:
+        return None
+    
+    team_id = user.team_id
+    user.team_id = None
+    change_team_stats(db, team_id, members=-1, levels=-user.level)
     db.commit()
+    identity_cache.delete(user.login)
+    emit_team_event(team_id, {"type": "member_left", "user_id": user_id})
     
     # Обновляем босса команды
     update_team_boss(db, team_id)
@@ -428,66 +638,76 @@ def get_team_members_count(db: Session, team_id: int):
     """Получить количество участников команды"""
     return db.query(models.User).filter(models.User.team_id == team_id).count()
 
-def update_team_boss_lives(db: Session, team_id: int, lives_change: int):
-    db_team = get_team(db, team_id)
-    if db_team:
-        db_team.boss_lives += lives_change
-        if db_team.boss_lives < 0:
-            db_team.boss_lives = 0
-        db.commit()
-        db.refresh(db_team)
-    return db_team
+def damage_team_boss(db: Session, team_id: int, damage: int, add_boss_level: bool = False):
+    """Атомарно нанести урон живому боссу команды.
+
+    Уменьшение выполняется одним UPDATE на стороне БД, поэтому одновременные
+    удары участников не теряются. Возвращает (boss_lives, boss_id) после удара
+    или None, если у команды нет живого босса. Коммит выполняет вызывающий код.
+    """
+    if add_boss_level:
+        # Бонус воина: урон увеличивается на уровень босса
+        damage = damage + select(models.Boss.level).where(
+            models.Boss.boss_id == models.Team.boss_id
+        ).scalar_subquery()
+    return db.execute(
+        update(models.Team)
+        .where(
+            models.Team.team_id == team_id,
+            models.Team.boss_id.isnot(None),
+            models.Team.boss_lives > 0
+        )
+        .values(boss_lives=func.greatest(models.Team.boss_lives - damage, 0))
+        .returning(models.Team.boss_lives, models.Team.boss_id)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+def claim_boss_defeat(db: Session, team_id: int, boss_id: int) -> bool:
+    """Забрать победу над боссом: ровно один вызов получит True"""
+    claimed = db.execute(
+        update(models.Team)
+        .where(
+            models.Team.team_id == team_id,
+            models.Team.boss_id == boss_id,
+            models.Team.boss_lives <= 0
+        )
+        .values(boss_id=None, boss_lives=0)
+        .returning(models.Team.team_id)
+        .execution_options(synchronize_session=False)
+    ).first()
+    return claimed is not None
 
 def update_team_boss(db: Session, team_id: int):
     """Обновить босса команды на основе количества участников и их уровней"""
-    team = get_team(db, team_id)
+    team = db.get(models.Team, team_id)
     if not team:
         return None
     
-    # Получаем всех участников команды
-    members = get_team_members(db, team_id)
+    # Количество и средний уровень - из счетчиков команды, без обхода участников
+    avg_level = get_team_average_level(team)
+    old_boss_id = team.boss_id
+    boss = None
     
-    if len(members) < 2:
+    if team.member_count < 2:
         # Если участников меньше 2, убираем босса
         team.boss_id = None
         team.boss_lives = 0
     else:
-        # Вычисляем средний уровень участников
-        avg_level = sum(member.level for member in members) / len(members)
-        avg_level = int(round(avg_level))
-        
-        # Определяем ID босса на основе среднего уровня
-        boss_id = get_boss_id_by_level(avg_level)
+        # Босс по среднему уровню из каталога в памяти (см. Boss.min_team_level)
+        boss = get_boss_catalog().for_level(int(round(avg_level)))
         
         # Если босс изменился или его нет, назначаем нового
-        if team.boss_id != boss_id:
-            boss = get_boss(db, boss_id)
-            if boss:
-                team.boss_id = boss_id
-                team.boss_lives = boss.base_lives
+        if boss and team.boss_id != boss.boss_id:
+            team.boss_id = boss.boss_id
+            team.boss_lives = boss.base_lives
     
+    boss_id, boss_lives = team.boss_id, team.boss_lives
     db.commit()
-    db.refresh(team)
-    return team
-
-def get_boss_id_by_level(avg_level: int) -> int:
-    """Определить ID босса на основе среднего уровня команды"""
-    if avg_level <= 10:
-        return 1
-    elif avg_level <= 20:
-        return 2
-    elif avg_level <= 30:
-        return 3
-    elif avg_level <= 40:
-        return 4
-    elif avg_level <= 50:
-        return 5
-    elif avg_level <= 60:
-        return 6
-    elif avg_level <= 70:
-        return 7
+    if boss_id != old_boss_id:
+        emit_boss_changed(team_id, boss if boss_id else None, boss_lives)
     else:
-        return 8
+        emit_boss_state(team_id, boss_id, boss_lives)
+    return team
 
 # --- Boss CRUD ---
 def create_boss(db: Session, boss: schemas.BossCreate):
@@ -495,39 +715,55 @@ def create_boss(db: Session, boss: schemas.BossCreate):
     db.add(db_boss)
     db.commit()
     db.refresh(db_boss)
+    reference_cache.invalidate("bosses")
+    emit_reference_invalidated("bosses")
     return db_boss
 
-def get_boss(db: Session, boss_id: int):
-    return db.query(models.Boss).filter(models.Boss.boss_id == boss_id).first()
-
-def get_bosses(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Boss).offset(skip).limit(limit).all()
-
-def defeat_boss(db: Session, team_id: int):
+def defeat_boss(db: Session, team_id: int, boss_id: int = None):
     """Обработка победы над боссом"""
-    team = get_team(db, team_id)
-    if not team or not team.boss_id:
-        return None
+    if boss_id is None:
+        team = get_team(db, team_id)
+        if not team or not team.boss_id:
+            return None
+        boss_id = team.boss_id
     
-    boss = team.boss
+    boss = find_boss(boss_id)
     if not boss:
         return None
     
-    # Выдаем награду всем участникам команды
-    members = db.query(models.User).filter(models.User.team_id == team_id).all()
+    # Награду выдает только тот, кто первым зафиксировал победу
+    if not claim_boss_defeat(db, team_id, boss_id):
+        db.rollback()
+        return None
+    
+    # Считаем награды всех участников за один проход
+    members = db.query(
+        models.User.user_id, models.User.login, models.User.class_id
+    ).filter(models.User.team_id == team_id).all()
+    modifiers = get_users_modifiers(db, [member.user_id for member in members])
+    
+    gold_by_user = {}
     for member in members:
-        db_useritems = get_user_items(db, member.user_id)
-        id_user_items = [id_items.item_id for id_items in db_useritems]
-        
-        if 15 in id_user_items:
-            reward = boss.gold_reward * 2
-            update_user_gold_xp(db, member.user_id, gold_change=reward)
-        
-        update_user_gold_xp(db, member.user_id, gold_change=boss.gold_reward)
+        member_modifiers = modifiers[member.user_id]
+        gold_reward, _ = calculate_rewards(member.class_id, member_modifiers, boss.gold_reward)
+        if member_modifiers.double_gold_bosses:
+            bonus_gold, _ = calculate_rewards(member.class_id, member_modifiers, boss.gold_reward * 2)
+            gold_reward += bonus_gold
+        gold_by_user[member.user_id] = gold_reward
     
-    team.boss_id = None
-    team.boss_lives = 0
+    # Начисляем золото всем участникам одним UPDATE
+    if gold_by_user:
+        db.execute(
+            update(models.User)
+            .where(models.User.user_id.in_(list(gold_by_user)))
+            .values(gold=models.User.gold + case(gold_by_user, value=models.User.user_id, else_=0))
+            .execution_options(synchronize_session=False)
+        )
     db.commit()
+    for member in members:
+        identity_cache.delete(member.login)
+    emit_team_event(team_id, {"type": "boss_defeated", "boss_id": boss.boss_id})
+    emit_team_event(team_id, {"type": "reward", "boss_id": boss.boss_id, "gold_by_user": gold_by_user})
     
     # Назначаем нового босса
     update_team_boss(db, team_id)
@@ -547,13 +783,24 @@ def create_chat_message(db: Session, team_id: int, user_id: int, message: str):
     db.refresh(db_message)
     return db_message
 
-def get_team_chat_messages(db: Session, team_id: int, skip: int = 0, limit: int = 50):
-    """Получить сообщения чата команды"""
+def get_team_chat_messages(db: Session, team_id: int, skip: int = 0, limit: int = 50, before: int = None):
+    """Получить сообщения чата команды в хронологическом порядке.
+
+    before - курсор: вернуть сообщения старше message_id=before (по индексу
+    (team_id, message_id), без OFFSET). Без курсора работает прежний skip.
+    """
+    latest = select(models.ChatMessage.message_id).filter(models.ChatMessage.team_id == team_id)
+    if before is not None:
+        latest = latest.filter(models.ChatMessage.message_id < before)
+    else:
+        latest = latest.offset(skip)
+    latest = latest.order_by(models.ChatMessage.message_id.desc()).limit(limit)
+    
     return db.query(models.ChatMessage).options(
         joinedload(models.ChatMessage.user)
     ).filter(
-        models.ChatMessage.team_id == team_id
-    ).order_by(models.ChatMessage.timestamp.desc()).offset(skip).limit(limit).all()
+        models.ChatMessage.message_id.in_(latest.scalar_subquery())
+    ).order_by(models.ChatMessage.message_id).all()
 
 def delete_team_chat_messages(db: Session, team_id: int):
     """Удалить все сообщения чата команды"""
@@ -587,6 +834,12 @@ def delete_catalog(db: Session, catalog_id: int):
 def get_task(db: Session, task_id: int):
     return db.query(models.Task).filter(models.Task.task_id == task_id).first()
 
+def get_task_with_catalog(db: Session, task_id: int):
+    """Получить задачу вместе с каталогом одним запросом (для проверки владельца)"""
+    return db.query(models.Task).options(
+        joinedload(models.Task.catalog)
+    ).filter(models.Task.task_id == task_id).first()
+
 def get_catalog_tasks(db: Session, catalog_id: int, skip: int = 0, limit: int = 100):
     return db.query(models.Task).filter(models.Task.catalog_id == catalog_id).offset(skip).limit(limit).all()
 
@@ -612,35 +865,109 @@ def update_task(db: Session, task_id: int, task_update: schemas.TaskUpdate):
     db.refresh(db_task)
     return db_task
 
-def update_task_completion(db: Session, task_id: int, completed: str, user_id: int):
-    db_task = get_task(db, task_id=task_id)
-    if not db_task:
-        return None
+def update_task_completion(
+    db: Session,
+    task_id: int,
+    completed: str,
+    user_id: int,
+    class_id: int = None,
+    gold_change: int = 0,
+    points_change: int = 0,
+    today: date = None
+):
+    """Отметить выполнение задачи и начислить награды в одной транзакции.
+
+    Золото, опыт, повышение уровня и урон боссу применяются атомарными
+    UPDATE ... RETURNING, без чтения и перезаписи строк в Python.
+    Награда забирается вместе с отметкой Task.rewarded_on: обычная задача
+    награждается один раз, задача с ежедневным расписанием - раз в день,
+    поэтому ни повторный клик, ни снятие и повторная отметка не начисляют
+    ее дважды.
+    """
+    changed = None
+    if completed == 'true':
+        today = today or date.today()
+        has_schedule = exists().where(models.DailyTask.task_id == models.Task.task_id)
+        changed = db.execute(
+            update(models.Task)
+            .where(
+                models.Task.task_id == task_id,
+                or_(
+                    models.Task.rewarded_on.is_(None),
+                    and_(has_schedule, models.Task.rewarded_on < today)
+                )
+            )
+            .values(completed=completed, rewarded_on=today)
+            .returning(models.Task.task_id)
+            .execution_options(synchronize_session=False)
+        ).first()
     
-    user = get_user(db, user_id)
-    if not user:
+    if changed is None:
+        # Награда уже выдана (или задача снята с выполнения): меняется только статус
+        db.execute(
+            update(models.Task)
+            .where(models.Task.task_id == task_id, models.Task.completed != completed)
+            .values(completed=completed)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return get_task(db, task_id)
+    
+    # Золото и опыт
+    gold_reward, experience_reward = calculate_rewards(
+        class_id, get_user_modifiers(db, user_id), gold_change, points_change
+    )
+    user_row = db.execute(
+        update(models.User)
+        .where(models.User.user_id == user_id)
+        .values(gold=models.User.gold + gold_reward, points=models.User.points + experience_reward)
+        .returning(
+            models.User.login, models.User.level, models.User.points, models.User.max_points,
+            models.User.attack, models.User.team_id
+        )
+        .execution_options(synchronize_session=False)
+    ).first()
+    if user_row is None:
+        db.rollback()
         return None
     
-    # Если задача выполнена и пользователь в команде, наносим урон боссу
-    if completed == 'true' and user.team_id:
-        team = get_team(db, user.team_id)
-        if team and team.boss_id and team.boss_lives > 0:
-            damage = int(user.attack)
-            if user.class_id == 1:
-                boss = get_boss(db, team.boss_id)
-                damage = damage + boss.level
-            
-            new_lives = max(0, team.boss_lives - damage)
-            team.boss_lives = new_lives
-            
-            # Если босс побежден
-            if new_lives == 0:
-                defeat_boss(db, team.team_id)
+    # Повышение уровня (строка пользователя уже заблокирована этой транзакцией)
+    level, points, max_points, levels_gained = calculate_level_up(
+        user_row.level, user_row.points, user_row.max_points
+    )
+    if levels_gained:
+        change_team_stats(db, user_row.team_id, levels=levels_gained)
+        db.execute(
+            update(models.User)
+            .where(models.User.user_id == user_id)
+            .values(
+                level=level, points=points, max_points=max_points,
+                attack=models.User.attack + levels_gained
+            )
+            .execution_options(synchronize_session=False)
+        )
+    
+    # Урон боссу команды (атака до повышения уровня)
+    boss_hit = None
+    if user_row.team_id:
+        boss_hit = damage_team_boss(
+            db, user_row.team_id, int(user_row.attack), add_boss_level=(class_id == 1)
+        )
     
-    db_task.completed = completed
     db.commit()
-    db.refresh(db_task)
-    return db_task
+    identity_cache.delete(user_row.login)
+    if levels_gained:
+        emit_member_update(
+            user_row.team_id, user_id, level=level, attack=int(user_row.attack) + levels_gained
+        )
+    
+    if boss_hit is not None:
+        emit_boss_state(user_row.team_id, boss_hit.boss_id, boss_hit.boss_lives)
+        # Если босс побежден
+        if boss_hit.boss_lives == 0:
+            defeat_boss(db, user_row.team_id, boss_hit.boss_id)
+    
+    return get_task(db, task_id)
 
 
 def delete_task(db: Session, task_id: int):
@@ -699,15 +1026,49 @@ def get_daily_tasks_for_user_today(db: Session, user_id: int):
     
     return daily_tasks
 
-def get_tasks_with_daily_schedule(db: Session, catalog_id: int):
-    """Получить задачи каталога с информацией о ежедневном расписании"""
-    tasks = db.query(models.Task).filter(models.Task.catalog_id == catalog_id).all()
+# Разворачивание расписаний DailyTask в экземпляры по датам на стороне БД
+DAILY_TASK_INSTANCES_SQL = text("""
+    SELECT DISTINCT days.day::date AS day, t.task_id, t.name, t.complexity
+    FROM generate_series(CAST(:date_from AS date), CAST(:date_to AS date), interval '1 day') AS days(day)
+    JOIN daily_task dt ON dt.day_week::text = to_char(days.day, 'dy')
+    JOIN tasks t ON t.task_id = dt.task_id
+    JOIN catalogs c ON c.catalog_id = t.catalog_id
+    WHERE c.user_id = :user_id
+    ORDER BY day, t.task_id
+""")
+
+def iter_daily_task_instances(db: Session, user_id: int, date_from, date_to, batch_size: int = 500):
+    """Потоково выдавать пачки экземпляров ежедневных задач пользователя за период"""
+    result = db.execute(
+        DAILY_TASK_INSTANCES_SQL,
+        {"user_id": user_id, "date_from": date_from, "date_to": date_to},
+        execution_options={"stream_results": True}
+    )
+    for rows in result.partitions(batch_size):
+        yield rows
+
+def get_tasks_with_daily_schedule(
+    db: Session,
+    catalog_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: int = None
+):
+    """Получить задачи каталога с информацией о ежедневном расписании.
+
+    Расписания загружаются одним дополнительным запросом (selectinload).
+    Если передан after_id, используется курсорная пагинация по task_id
+    вместо OFFSET.
+    """
+    query = db.query(models.Task).options(
+        selectinload(models.Task.daily_tasks)
+    ).filter(models.Task.catalog_id == catalog_id)
     
-    for task in tasks:
-        # Загружаем ежедневные задачи для каждой задачи
-        daily_tasks = db.query(models.DailyTask).filter(
-            models.DailyTask.task_id == task.task_id
-        ).all()
-        task.daily_tasks = daily_tasks
+    if after_id is not None:
+        query = query.filter(models.Task.task_id > after_id)
     
-    return tasks
\ No newline at end of file
+    # ORDER BY до OFFSET/LIMIT: Query не принимает order_by после них
+    query = query.order_by(models.Task.task_id)
+    if after_id is None:
+        query = query.offset(skip)
+    return query.limit(limit).all()
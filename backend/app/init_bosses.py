@@ -10,6 +10,7 @@ BOSSES_DATA = [
         "name": "Слабый Гоблин",
         "base_lives": 1000,
         "level": 1,
+        "min_team_level": 0,
         "gold_reward": 100,
         "information": "Маленький зеленый вредитель из темных пещер.",
         "img_url": "images/boss1.png"
@@ -19,6 +20,7 @@ BOSSES_DATA = [
         "name": "Орк-Воин",
         "base_lives": 2000,
         "level": 2,
+        "min_team_level": 11,
         "gold_reward": 200,
         "information": "Сильный воин орков с большим топором.",
         "img_url": "images/boss2.png"
@@ -28,6 +30,7 @@ BOSSES_DATA = [
         "name": "Тролль-Берсерк",
         "base_lives": 3000,
         "level": 3,
+        "min_team_level": 21,
         "gold_reward": 300,
         "information": "Огромный тролль в состоянии ярости.",
         "img_url": "images/boss3.png"
@@ -37,6 +40,7 @@ BOSSES_DATA = [
         "name": "Каменный Голем",
         "base_lives": 4000,
         "level": 4,
+        "min_team_level": 31,
         "gold_reward": 400,
         "information": "Древний страж, созданный из магического камня.",
         "img_url": "images/boss4.png"
@@ -46,6 +50,7 @@ BOSSES_DATA = [
         "name": "Серебряный дракон",
         "base_lives": 5000,
         "level": 5,
+        "min_team_level": 41,
         "gold_reward": 500,
         "information": "Молодой дракон с огненным дыханием.",
         "img_url": "images/boss5.png"
@@ -55,6 +60,7 @@ BOSSES_DATA = [
         "name": "Демон-Стражник",
         "base_lives": 6000,
         "level": 6,
+        "min_team_level": 51,
         "gold_reward": 600,
         "information": "Могущественный демон из преисподней.",
         "img_url": "images/boss6.png"
@@ -64,6 +70,7 @@ BOSSES_DATA = [
         "name": "Пожиратель Душ",
         "base_lives": 7000,
         "level": 7,
+        "min_team_level": 61,
         "gold_reward": 700,
         "information": "Опасное существо из глубин подземелья.",
         "img_url": "images/boss7.png"
@@ -73,6 +80,7 @@ BOSSES_DATA = [
         "name": "Повелитель Тьмы",
         "base_lives": 8000,
         "level": 8,
+        "min_team_level": 71,
         "gold_reward": 800,
         "information": "Древний владыка темных сил.",
         "img_url": "images/boss8.png"
@@ -0,0 +1,134 @@
+"""Движок эффектов предметов.
+
+Активные предметы пользователя компилируются по полям Item.bonus_type /
+Item.bonus_data (см. init_items.py) в компактную запись модификаторов.
+Запись кэшируется на пользователя и сбрасывается при переключении предметов
+(на всех воркерах - через broadcast), поэтому расчет наград не требует
+запроса инвентаря.
+"""
+from typing import Iterable, NamedTuple, Optional, Tuple
+import os
+import random
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+from .cache import InvalidatedCache, TTLCache
+
+
+class ItemModifiers(NamedTuple):
+    exp_bonus_percent: int = 0          # exp_multiplier: +N% опыта
+    gold_bonus_percent: int = 0         # gold_multiplier: +N% золота
+    double_points_chance: int = 0       # double_points: шанс N% удвоить опыт
+    double_gold_chance: int = 0         # double_gold: шанс N% удвоить золото
+    chains_protecting_chance: int = 0   # chains_protecting: шанс N% не потерять жизни
+    protecting_lives: int = 0           # protecting_lives: на N единиц урона меньше
+    double_gold_bosses: int = 0         # double_gold_bosses: удвоенное золото с боссов
+
+
+NO_MODIFIERS = ItemModifiers()
+
+# bonus_type -> поле ItemModifiers; остальные типы (attack, max_health, разовые)
+# применяются в момент активации предмета
+_BONUS_FIELDS = {
+    "exp_multiplier": "exp_bonus_percent",
+    "gold_multiplier": "gold_bonus_percent",
+    "double_points": "double_points_chance",
+    "double_gold": "double_gold_chance",
+    "chains_protecting": "chains_protecting_chance",
+    "protecting_lives": "protecting_lives",
+    "double_gold_bosses": "double_gold_bosses",
+}
+
+# Кэш модификаторов, ключ - user_id. У каждого воркера своя копия,
+# поэтому удаления рассылаются остальным (см. main.dispatch_broadcast)
+modifiers_cache = InvalidatedCache(TTLCache(
+    maxsize=int(os.getenv("ITEM_MODIFIERS_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("ITEM_MODIFIERS_CACHE_TTL", "300")),
+))
+
+
+def compile_modifiers(bonuses: Iterable[Tuple[Optional[str], Optional[int]]]) -> ItemModifiers:
+    """Свернуть пары (bonus_type, bonus_data) активных предметов в ItemModifiers"""
+    values = {}
+    for bonus_type, bonus_data in bonuses:
+        field = _BONUS_FIELDS.get(bonus_type)
+        if field:
+            values[field] = values.get(field, 0) + (bonus_data or 0)
+    return ItemModifiers(**values) if values else NO_MODIFIERS
+
+
+def _active_bonuses_query(user_ids):
+    return select(
+        models.UserItem.user_id, models.Item.bonus_type, models.Item.bonus_data
+    ).join(models.Item, models.Item.item_id == models.UserItem.item_id).filter(
+        models.UserItem.user_id.in_(user_ids),
+        models.UserItem.active == 'true'
+    )
+
+
+def get_user_modifiers(db: Session, user_id: int) -> ItemModifiers:
+    modifiers = modifiers_cache.get(user_id)
+    if modifiers is None:
+        rows = db.execute(_active_bonuses_query([user_id])).all()
+        modifiers = compile_modifiers((row.bonus_type, row.bonus_data) for row in rows)
+        modifiers_cache.set(user_id, modifiers)
+    return modifiers
+
+
+def get_users_modifiers(db: Session, user_ids) -> dict:
+    """Модификаторы для группы пользователей: один запрос на всех, кого нет в кэше"""
+    result = {}
+    missing = []
+    for user_id in user_ids:
+        modifiers = modifiers_cache.get(user_id)
+        if modifiers is None:
+            missing.append(user_id)
+        else:
+            result[user_id] = modifiers
+    
+    if missing:
+        bonuses = {user_id: [] for user_id in missing}
+        for row in db.execute(_active_bonuses_query(missing)):
+            bonuses[row.user_id].append((row.bonus_type, row.bonus_data))
+        for user_id, user_bonuses in bonuses.items():
+            modifiers = compile_modifiers(user_bonuses)
+            modifiers_cache.set(user_id, modifiers)
+            result[user_id] = modifiers
+    return result
+
+
+async def get_user_modifiers_async(db, user_id: int) -> ItemModifiers:
+    modifiers = modifiers_cache.get(user_id)
+    if modifiers is None:
+        rows = (await db.execute(_active_bonuses_query([user_id]))).all()
+        modifiers = compile_modifiers((row.bonus_type, row.bonus_data) for row in rows)
+        modifiers_cache.set(user_id, modifiers)
+    return modifiers
+
+
+def invalidate_user_modifiers(user_id: int):
+    modifiers_cache.delete(user_id)
+
+
+def calculate_rewards(class_id, modifiers: ItemModifiers, gold_change: int = 0, points_change: int = 0):
+    """Рассчитать золото и опыт с учетом класса и предметов пользователя"""
+    experience_reward = points_change
+    gold_reward = gold_change
+    
+    # Классовые мультипликаторы
+    if class_id == 2:
+        experience_reward = int(experience_reward * 1.1)
+    elif class_id == 3:
+        gold_reward = int(gold_reward * 1.1)
+    
+    # Мультипликаторы вещей
+    experience_reward += int(points_change * modifiers.exp_bonus_percent / 100)
+    gold_reward += int(gold_change * modifiers.gold_bonus_percent / 100)
+    if modifiers.double_points_chance and random.random() * 100 < modifiers.double_points_chance:
+        experience_reward *= 2
+    if modifiers.double_gold_chance and random.random() * 100 < modifiers.double_gold_chance:
+        gold_reward *= 2
+    
+    return gold_reward, experience_reward
@@ -1,22 +1,32 @@
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Request, APIRouter
+from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Request, APIRouter, Query
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates 
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any, Optional, Literal
 from datetime import timedelta, date
+import json
 import random 
 import os 
 
-from . import crud, models, schemas, security
-from .database import SessionLocal, engine, get_db
+from . import async_crud, crud, metrics, models, profiler, schemas, security, ws_protocol
+from .broadcast import broadcast
+from .cache import identity_cache, user_from_cache, user_to_cache
+from .chat_buffer import chat_buffer
+from .item_effects import modifiers_cache
+from .websocket_manager import team_manager
+from .boss_catalog import find_boss, get_boss_catalog
+from .reference_cache import reference_cache
+from .database import SessionLocal, AsyncSessionLocal, engine, async_engine, get_db, get_async_db, get_pool_stats
 
 BACKEND_APP_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT_DIR = os.path.abspath(os.path.join(BACKEND_APP_DIR, "..")) 
 FRONTEND_DIR = os.path.abspath(os.path.join(PROJECT_ROOT_DIR, "..", "frontend")) 
 
-models.Base.metadata.create_all(bind=engine)
+# Схема БД создается и обновляется миграциями: python migrate.py upgrade
 
 app = FastAPI(
     title="Gamify Planner API",
@@ -24,9 +34,20 @@ app = FastAPI(
     version="0.1.1"
 )
 
+# Метрики запросов и SQL (см. /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
+
+# Профилировщик SQL с поиском N+1 (только для разработки: SQL_PROFILE=1)
+if profiler.SQL_PROFILE_ENABLED:
+    app.add_middleware(profiler.QueryProfilerMiddleware)
+    profiler.instrument_engine(engine)
+    profiler.instrument_engine(async_engine.sync_engine)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -38,11 +59,18 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         if login is None:
             raise credentials_exception
         token_data = schemas.TokenData(username=login)
-    except security.jwt.PyJWTError:
+    except security.jwt.JWTError:
         raise credentials_exception
-    user = crud.get_user_by_login(db, login=token_data.username)
+    
+    # Сначала ищем пользователя в кэше, чтобы не обращаться к БД на каждый запрос
+    cached_user = identity_cache.get(token_data.username)
+    if cached_user is not None:
+        return user_from_cache(cached_user)
+    
+    user = await async_crud.get_user_by_login(db, login=token_data.username)
     if user is None:
         raise credentials_exception
+    identity_cache.set(token_data.username, user_to_cache(user))
     return user
 
 async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
@@ -61,9 +89,19 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return crud.create_user(db=db, user=user)
 
 @api_router.post("/auth/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_login(db, login=form_data.username)
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await async_crud.get_user_by_login(db, login=form_data.username)
+    try:
+        password_ok = user is not None and await security.verify_password_async(
+            form_data.password, user.hashed_password
+        )
+    except security.PasswordHasherBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, try again later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect login or password",
@@ -80,7 +118,7 @@ async def read_users_me(current_user: models.User = Depends(get_current_active_u
     return current_user
 
 @api_router.put("/users/me", response_model=schemas.User)
-async def update_user_me(
+def update_user_me(
     user_update: schemas.UserUpdate, 
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(get_current_active_user)
@@ -124,7 +162,7 @@ def update_current_user_lives(
 
 
 @api_router.get("/users/{user_id}", response_model=schemas.UserProfile)
-async def get_user_profile(
+def get_user_profile(
     user_id: int,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
@@ -152,9 +190,24 @@ async def get_user_profile(
 
 
 # --- Class endpoints ---
+def _load_reference(loader, schema):
+    """Загрузчик всего справочника для reference_cache: строки -> словари схемы"""
+    def load():
+        db = SessionLocal()
+        try:
+            return [
+                schema.model_validate(row, from_attributes=True).model_dump(mode="json")
+                for row in loader(db, skip=0, limit=None)
+            ]
+        finally:
+            db.close()
+    return load
+
 @api_router.get("/classes/", response_model=List[schemas.Class])
-def get_all_classes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_classes(db, skip=skip, limit=limit)
+def get_all_classes(request: Request, skip: int = 0, limit: int = 100):
+    return reference_cache.response(
+        request, "classes", _load_reference(crud.get_classes, schemas.Class), skip, limit
+    )
 
 @api_router.get("/classes/{class_id}", response_model=schemas.Class)
 def get_class_details(class_id: int, db: Session = Depends(get_db)):
@@ -166,8 +219,10 @@ def get_class_details(class_id: int, db: Session = Depends(get_db)):
 # --- Item endpoints ---
 
 @api_router.get("/items", response_model=List[schemas.Item])  # Убрал завершающий слеш
-def get_all_items_in_shop(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_items(db, skip=skip, limit=limit)
+def get_all_items_in_shop(request: Request, skip: int = 0, limit: int = 100):
+    return reference_cache.response(
+        request, "items", _load_reference(crud.get_items, schemas.Item), skip, limit
+    )
 
 @api_router.get("/items/{item_id}", response_model=schemas.Item)
 def get_shop_item_details(item_id: int, db: Session = Depends(get_db)):
@@ -179,11 +234,16 @@ def get_shop_item_details(item_id: int, db: Session = Depends(get_db)):
 @api_router.post("/items/buy", response_model=schemas.BuyItemResponse)
 async def buy_item(
     buy_request: schemas.BuyItemRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     # Получаем предмет из базы данных
-    item_to_buy = crud.get_item(db, item_id=buy_request.item_id)
+    item_to_buy = await async_crud.get_item(db, item_id=buy_request.item_id)
+    if item_to_buy is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Item not found in shop"
+        )
     item_data = {
     "item_id": item_to_buy.item_id,
     "name": item_to_buy.name,
@@ -194,14 +254,9 @@ async def buy_item(
     "bonus_type": item_to_buy.bonus_type,
     "bonus_data": item_to_buy.bonus_data
     }
-    if item_to_buy is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Item not found in shop"
-        )
     
     # Проверяем, есть ли у пользователя уже этот предмет
-    existing_user_item = crud.get_user_item(db, user_id=current_user.user_id, item_id=buy_request.item_id)
+    existing_user_item = await async_crud.get_user_item(db, user_id=current_user.user_id, item_id=buy_request.item_id)
     if existing_user_item:
         return schemas.BuyItemResponse(
             success=True,
@@ -229,33 +284,37 @@ async def buy_item(
         )
     
     try:
-        # Списываем золото у пользователя
-        updated_user = crud.update_user_gold_xp(
-            db, 
-            user_id=current_user.user_id, 
-            gold_change=-item_to_buy.price
-        )
+        # Списываем золото у пользователя: баланс проверяется в самом UPDATE,
+        # current_user может быть из кэша и устареть
+        cost = await async_crud.get_purchase_cost(db, current_user.user_id, current_user.class_id, item_to_buy.price)
+        user_gold = await async_crud.spend_user_gold(db, current_user.user_id, cost)
+        if user_gold is None:
+            await db.rollback()
+            return schemas.BuyItemResponse(
+                success=True,
+                message=f"Successfully purchased {item_to_buy.name}",
+                user_gold=current_user.gold,
+                item=item_data
+            )
         
-        # Добавляем предмет в инвентарь пользователя
-        user_item = crud.add_item_to_user_inventory(
+        # Добавляем предмет в инвентарь пользователя (коммит вместе со списанием)
+        user_item = await async_crud.add_item_to_user_inventory(
             db, 
             user_id=current_user.user_id, 
             item_id=buy_request.item_id
         )
-        
-        # Обновляем данные пользователя
-        db.refresh(current_user)
+        identity_cache.delete(current_user.login)
         
         return schemas.BuyItemResponse(
             success=True,
             message=f"Successfully purchased {item_to_buy.name}",
-            user_gold=current_user.gold,
+            user_gold=user_gold,
             item=item_data
         )
     
     except Exception as e:
         # В случае ошибки откатываем транзакцию
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to purchase item: {str(e)}"
@@ -273,9 +332,13 @@ def buy_item_from_shop(item_id: int, db: Session = Depends(get_db), current_user
         raise HTTPException(status_code=404, detail="Item not found in shop")
     if current_user.gold < item_to_buy.price:
         raise HTTPException(status_code=400, detail="Not enough gold")
-    crud.update_user_gold_xp(db, user_id=current_user.user_id, gold_change=-item_to_buy.price)
+    # Баланс перепроверяется в UPDATE: current_user может быть из кэша
+    cost = crud.get_purchase_cost(db, current_user.user_id, current_user.class_id, item_to_buy.price)
+    if crud.spend_user_gold(db, current_user.user_id, cost) is None:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Not enough gold")
     user_item = crud.add_item_to_user_inventory(db, user_id=current_user.user_id, item_id=item_id)
-    db.refresh(current_user)
+    identity_cache.delete(current_user.login)
     return user_item
 
 @api_router.put("/user-items/{item_id}/toggle-active", response_model=schemas.UserItem)
@@ -293,7 +356,6 @@ def toggle_item_active_status(
     updated_user_item = crud.update_user_item_active_status(
         db=db, user_id=current_user.user_id, item_id=item_id, active=active_status.active
     )
-    db.refresh(current_user)
     return updated_user_item
 
 @api_router.get("/teams/my-team", response_model=schemas.TeamResponse)
@@ -304,12 +366,12 @@ def get_my_team(
     if not current_user.team_id:
         raise HTTPException(status_code=404, detail="You are not in a team")
     
-    team = crud.get_team(db, current_user.team_id)
-    if not team:
+    # Команда, босс, участники и средний уровень - одним запросом
+    team_view = crud.get_team_view(db, current_user.team_id)
+    if not team_view:
         raise HTTPException(status_code=404, detail="Team not found")
-    
-    # Получаем участников команды
-    members = crud.get_team_members(db, team.team_id)
+    team, member_count, average_level = team_view
+    boss = find_boss(team.boss_id)
     
     # Создаем объект TeamResponse
     team_response = schemas.TeamResponse(
@@ -320,9 +382,11 @@ def get_my_team(
         boss_id=team.boss_id,
         boss_lives=team.boss_lives,
         created_at=team.created_at,
-        boss=team.boss,
+        boss=boss._asdict() if boss else None,
         owner=team.owner,
-        members=[schemas.UserSimple.from_orm(member) for member in members]
+        members=[schemas.UserSimple.from_orm(member) for member in team.members],
+        member_count=member_count,
+        average_level=average_level
     )
     
     return team_response
@@ -513,15 +577,18 @@ def create_new_boss(boss: schemas.BossCreate, db: Session = Depends(get_db)):
     return crud.create_boss(db=db, boss=boss)
 
 @api_router.get("/bosses", response_model=List[schemas.Boss])
-def list_available_bosses(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_bosses(db, skip=skip, limit=limit)
+def list_available_bosses(request: Request, skip: int = 0, limit: int = 100):
+    # Боссы уже в памяти (каталог), БД не нужна
+    def load():
+        return [boss._asdict() for boss in sorted(get_boss_catalog().all(), key=lambda boss: boss.boss_id)]
+    return reference_cache.response(request, "bosses", load, skip, limit)
 
 @api_router.get("/bosses/{boss_id}", response_model=schemas.Boss)
-def get_boss_details(boss_id: int, db: Session = Depends(get_db)):
-    db_boss = crud.get_boss(db, boss_id=boss_id)
-    if db_boss is None:
+def get_boss_details(boss_id: int):
+    boss = find_boss(boss_id)
+    if boss is None:
         raise HTTPException(status_code=404, detail="Boss not found")
-    return db_boss
+    return boss._asdict()
 
 @api_router.post("/teams/{team_id}/attack-boss", response_model=schemas.BossAttackResult)
 def attack_team_boss(
@@ -543,16 +610,21 @@ def attack_team_boss(
     if team.boss_lives <= 0:
         raise HTTPException(status_code=400, detail="Boss is already defeated")
     
-    boss = team.boss
+    boss = find_boss(team.boss_id)
     if not boss:
         raise HTTPException(status_code=404, detail="Boss not found")
     
     # Вычисляем урон
     damage = current_user.attack
     
-    # Наносим урон боссу
-    new_lives = max(0, team.boss_lives - damage)
-    team.boss_lives = new_lives
+    # Наносим урон боссу атомарно на стороне БД
+    boss_hit = crud.damage_team_boss(db, team_id, damage)
+    if boss_hit is None:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Boss is already defeated")
+    db.commit()
+    new_lives = boss_hit.boss_lives
+    crud.emit_boss_state(team_id, boss_hit.boss_id, new_lives)
     
     boss_defeated = False
     rewards = None
@@ -560,15 +632,13 @@ def attack_team_boss(
     # Проверяем победу над боссом
     if new_lives == 0:
         boss_defeated = True
-        defeat_result = crud.defeat_boss(db, team_id)
+        defeat_result = crud.defeat_boss(db, team_id, boss_hit.boss_id)
         if defeat_result:
             rewards = {
                 "gold": defeat_result["gold_reward"],
                 "members_rewarded": defeat_result["members_count"]
             }
     
-    db.commit()
-    
     return schemas.BossAttackResult(
         message=f"You dealt {damage} damage to {boss.name}!",
         player_damage_done=damage,
@@ -584,6 +654,7 @@ def get_team_chat(
     team_id: int,
     skip: int = 0,
     limit: int = 50,
+    before: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
@@ -591,8 +662,8 @@ def get_team_chat(
     if current_user.team_id != team_id:
         raise HTTPException(status_code=403, detail="You are not a member of this team")
     
-    messages = crud.get_team_chat_messages(db, team_id, skip, limit)
-    return messages[::-1]  # Возвращаем в хронологическом порядке
+    # before - message_id самого старого загруженного сообщения (курсор)
+    return crud.get_team_chat_messages(db, team_id, skip=skip, limit=limit, before=before)
 
 @api_router.post("/teams/{team_id}/chat", response_model=schemas.ChatMessage)
 def send_chat_message(
@@ -651,17 +722,21 @@ def create_task(task: schemas.TaskCreate, db: Session = Depends(get_db), current
     return crud.create_task(db=db, task=task)
 
 @api_router.get("/catalogs/{catalog_id}/tasks", response_model=List[schemas.Task])
-def get_catalog_tasks(catalog_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
+def get_catalog_tasks(
+    catalog_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
     # Verify catalog belongs to user
     catalog = crud.get_catalog(db, catalog_id=catalog_id)
     if not catalog or catalog.user_id != current_user.user_id:
         raise HTTPException(status_code=403, detail="Not authorized to view tasks in this catalog")
     
-    # Используем новую функцию для получения задач с ежедневным расписанием
-    tasks = crud.get_tasks_with_daily_schedule(db, catalog_id)
-    
-    # Применяем пагинацию
-    return tasks[skip:skip + limit]
+    # Пагинация выполняется в SQL; after_id - курсор (последний полученный task_id)
+    return crud.get_tasks_with_daily_schedule(db, catalog_id, skip=skip, limit=limit, after_id=after_id)
 
 @api_router.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_task(task_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
@@ -756,11 +831,11 @@ def update_task_completion(
     current_user: models.User = Depends(get_current_active_user)
 ):
     # Verify task belongs to user's catalog
-    task = crud.get_task(db, task_id=task_id)
+    task = crud.get_task_with_catalog(db, task_id=task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    catalog = crud.get_catalog(db, catalog_id=task.catalog_id)
+    catalog = task.catalog
     if not catalog or catalog.user_id != current_user.user_id:
         raise HTTPException(status_code=403, detail="Not authorized to update this task")
     
@@ -773,13 +848,15 @@ def update_task_completion(
         "hard": [50, 80]
     }
     
-    updated_task = crud.update_task_completion(db=db, task_id=task_id, completed=completed_status.completed, user_id=current_user.user_id)
-    if completed_status.completed == "true":
-        crud.update_user_gold_xp(
-            db,
-            user_id=current_user.user_id,
-            gold_change=rewards[task.complexity][0],
-            points_change=rewards[task.complexity][1])
+    updated_task = crud.update_task_completion(
+        db=db,
+        task_id=task_id,
+        completed=completed_status.completed,
+        user_id=current_user.user_id,
+        class_id=current_user.class_id,
+        gold_change=rewards[task.complexity][0],
+        points_change=rewards[task.complexity][1]
+    )
     return updated_task
 
 @api_router.get("/tasks/daily/today", response_model=List[schemas.Task])
@@ -790,46 +867,127 @@ def get_today_daily_tasks(
     """Получить ежедневные задачи на сегодня"""
     return crud.get_daily_tasks_for_user_today(db, current_user.user_id)
 
-# --- WebSocket для чата ---
-class TeamConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+MAX_INSTANCES_RANGE_DAYS = 366
+
+@api_router.get("/tasks/instances", response_model=List[schemas.DailyTaskInstance])
+def get_daily_task_instances(
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Экземпляры ежедневных задач по датам за период [from, to]"""
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="'to' must not be earlier than 'from'")
+    if (date_to - date_from).days >= MAX_INSTANCES_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must not exceed {MAX_INSTANCES_RANGE_DAYS} days")
+    
+    user_id = current_user.user_id
+    
+    def generate():
+        # Собственная сессия: ответ отдается потоково уже после выхода из обработчика
+        db = SessionLocal()
+        try:
+            yield "["
+            separator = ""
+            for rows in crud.iter_daily_task_instances(db, user_id, date_from, date_to):
+                chunk = ",".join(
+                    json.dumps({
+                        "task_id": row.task_id,
+                        "instance_id": f"{row.task_id}_{row.day.isoformat()}",
+                        "name": row.name,
+                        "complexity": row.complexity,
+                        "completed": False,
+                        "date": row.day.isoformat(),
+                        "is_daily_instance": True,
+                        "original_task_id": row.task_id
+                    }, ensure_ascii=False)
+                    for row in rows
+                )
+                yield separator + chunk
+                separator = ","
+            yield "]"
+        finally:
+            db.close()
     
-    async def connect(self, websocket: WebSocket, team_id: int):
-        await websocket.accept()
-        if team_id not in self.active_connections:
-            self.active_connections[team_id] = []
-        self.active_connections[team_id].append(websocket)
-    
-    def disconnect(self, websocket: WebSocket, team_id: int):
-        if team_id in self.active_connections:
-            if websocket in self.active_connections[team_id]:
-                self.active_connections[team_id].remove(websocket)
-            if not self.active_connections[team_id]:
-                del self.active_connections[team_id]
-    
-    async def send_to_team(self, message: str, team_id: int):
-        if team_id in self.active_connections:
-            for connection in self.active_connections[team_id]:
-                try:
-                    await connection.send_text(message)
-                except:
-                    # Удаляем неактивные соединения
-                    if connection in self.active_connections[team_id]:
-                        self.active_connections[team_id].remove(connection)
-
-team_manager = TeamConnectionManager()
+    return StreamingResponse(generate(), media_type="application/json")
+
+# --- WebSocket для чата ---
+
+def publish_team_event(team_id: int, event: Dict[str, Any]):
+    """События crud (здоровье босса и т.п.) уходят в чат команды на всех воркерах"""
+    broadcast.publish_threadsafe({"team_id": team_id, "event": ws_protocol.envelope({**event, "team_id": team_id})})
+
+crud.team_event_listeners.append(publish_team_event)
+
+def publish_identity_invalidated(login: str):
+    """Удаление пользователя из кэша доходит до кэшей остальных воркеров"""
+    broadcast.publish_threadsafe({"identity": login})
+
+identity_cache.invalidation_listeners.append(publish_identity_invalidated)
+
+def publish_modifiers_invalidated(user_id: int):
+    """Смена активных предметов сбрасывает модификаторы наград на всех воркерах"""
+    broadcast.publish_threadsafe({"modifiers": user_id})
+
+modifiers_cache.invalidation_listeners.append(publish_modifiers_invalidated)
+
+# Справочники кэшируются в каждом воркере: об изменении узнают все воркеры
+def publish_reference_invalidated(kind: str):
+    broadcast.publish_threadsafe({"reference": kind})
+
+crud.reference_data_listeners.append(publish_reference_invalidated)
+
+async def dispatch_broadcast(event: Dict[str, Any]):
+    """События broadcast: сброс кэшей или события команд"""
+    if "reference" in event:
+        reference_cache.invalidate(event["reference"])
+        return
+    if "identity" in event:
+        identity_cache.delete_local(event["identity"])
+        return
+    if "modifiers" in event:
+        modifiers_cache.delete_local(event["modifiers"])
+        return
+    await team_manager.deliver_local(event)
+
+async def authenticate_websocket(token: str) -> models.User:
+    """Пользователь по токену для WebSocket.
+
+    Сокет живет долго, поэтому сессию БД он не держит: при промахе кэша
+    identity_cache соединение берется из пула только на время одного запроса.
+    """
+    async with AsyncSessionLocal() as db:
+        return await get_current_user(token=token, db=db)
+
+@app.on_event("startup")
+async def start_broadcast():
+    await broadcast.connect(dispatch_broadcast)
+    # Справочник боссов загружается один раз при старте воркера
+    try:
+        await run_in_threadpool(get_boss_catalog)
+    except Exception as e:
+        print(f"Boss catalog is not loaded at startup: {e}")
+    chat_buffer.start()
+
+@app.on_event("shutdown")
+async def stop_broadcast():
+    await chat_buffer.stop()
+    await broadcast.disconnect()
+
+metrics.register(metrics.Gauge(
+    "websocket_connections", "Open team chat WebSocket connections per team room", ("team_id",),
+    lambda: {(str(team_id),): len(connections) for team_id, connections in team_manager.active_connections.items()}
+))
 
 @api_router.websocket("/ws/team-chat/{team_id}/{token}")
 async def team_chat_websocket(
     websocket: WebSocket, 
     team_id: int, 
-    token: str, 
-    db: Session = Depends(get_db)
+    token: str
 ):
     try:
         # Проверяем токен
-        user = await get_current_user(token=token, db=db)
+        user = await authenticate_websocket(token)
         
         # Проверяем, что пользователь в команде
         if user.team_id != team_id:
@@ -840,18 +998,24 @@ async def team_chat_websocket(
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
     
-    await team_manager.connect(websocket, team_id)
+    # ?format=msgpack - бинарные кадры MessagePack вместо JSON
+    frame_format = ws_protocol.negotiate_format(websocket.query_params.get("format"))
+    await team_manager.connect(websocket, team_id, user.user_id, frame_format)
     
     try:
         while True:
-            data = await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE))
+            data = ws_protocol.decode_chat_text(message.get("text"), message.get("bytes"))
+            if not data:
+                continue
             
-            # Сохраняем сообщение в базе данных
-            message = crud.create_chat_message(db, team_id, user.user_id, data)
+            # Сообщение сохраняется в БД пачкой, рассылка не ждет записи
+            chat_buffer.add(team_id, user.user_id, data)
             
             # Отправляем сообщение всем участникам команды
-            formatted_message = f"{user.nickname}: {data}"
-            await team_manager.send_to_team(formatted_message, team_id)
+            await team_manager.send_to_team(ws_protocol.chat_event(user.user_id, user.nickname, data), team_id)
             
     except WebSocketDisconnect:
         team_manager.disconnect(websocket, team_id)
@@ -893,9 +1057,9 @@ class ChatMessage(ChatMessageBase):
     timestamp: str
 
 @api_router.websocket("/ws/chat/{room_name}/{token}")
-async def websocket_endpoint(websocket: WebSocket, room_name: str, token: str, db: Session = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket, room_name: str, token: str):
     try:
-        user = await get_current_user(token=token, db=db)
+        user = await authenticate_websocket(token)
     except HTTPException:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
@@ -915,9 +1079,38 @@ async def websocket_endpoint(websocket: WebSocket, room_name: str, token: str, d
         manager.disconnect(websocket, room_name)
         await manager.broadcast(f"User {user.nickname} disconnected due to an error.", room_name)
 
+# --- Метрики ---
+@api_router.get("/metrics/db-pool")
+def get_db_pool_metrics():
+    """Состояние пулов соединений с БД текущего воркера"""
+    return get_pool_stats()
+
 # Подключаем API роутер
 app.include_router(api_router, prefix="/api")
 
+_POOL_GAUGE_FIELDS = ("size", "checked_out", "in_use")
+
+metrics.register(metrics.Gauge(
+    "db_pool_connections", "Database pool connections by state", ("pool", "state"),
+    lambda: {
+        (pool_name, field): pool_stats[field]
+        for pool_name, pool_stats in get_pool_stats().items()
+        for field in _POOL_GAUGE_FIELDS
+    }
+))
+metrics.register(metrics.CallbackCounter(
+    "db_pool_checkout_wait_seconds_total", "Total time spent waiting for a pooled connection", ("pool",),
+    lambda: {(pool_name,): pool_stats["wait_seconds_total"] for pool_name, pool_stats in get_pool_stats().items()}
+))
+metrics.register(metrics.CallbackCounter(
+    "db_pool_checkout_timeouts_total", "Pool checkouts that timed out", ("pool",),
+    lambda: {(pool_name,): pool_stats["timeouts"] for pool_name, pool_stats in get_pool_stats().items()}
+))
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Обслуживание фронтенда
 @app.get("/{path:path}", response_class=HTMLResponse)
 async def serve_frontend_page(request: Request, path: str):
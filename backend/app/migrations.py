@@ -0,0 +1,122 @@
+"""Версионные миграции схемы БД.
+
+Миграции - SQL-файлы backend/migrations/NNNN_описание.sql, применяются по
+порядку номеров и записываются в таблицу schema_migrations. Файл с
+директивой "-- migrate: no-transaction" выполняется по одному выражению вне
+транзакции (нужно для CREATE INDEX CONCURRENTLY), остальные - в одной
+транзакции вместе с записью версии.
+
+Начальная версия 0000_initial_schema создает таблицы по моделям на пустой БД
+или просто фиксируется, если таблицы уже созданы прежним create_all.
+"""
+import os
+import re
+
+from sqlalchemy import inspect, text
+
+from . import models
+from .database import engine
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+INITIAL_VERSION = "0000_initial_schema"
+NO_TRANSACTION_DIRECTIVE = "-- migrate: no-transaction"
+
+_MIGRATION_FILE_RE = re.compile(r"^(\d{4}_[\w-]+)\.sql$")
+
+
+def _ensure_migrations_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version VARCHAR(255) PRIMARY KEY,"
+        " applied_at TIMESTAMP NOT NULL DEFAULT now())"
+    ))
+
+
+def _record_version(connection, version: str):
+    connection.execute(
+        text("INSERT INTO schema_migrations (version) VALUES (:version)"),
+        {"version": version}
+    )
+
+
+def get_applied_versions():
+    with engine.begin() as connection:
+        _ensure_migrations_table(connection)
+        rows = connection.execute(text("SELECT version FROM schema_migrations"))
+        return {row.version for row in rows}
+
+
+def get_migration_files():
+    """Список (version, path) SQL-миграций по возрастанию номера"""
+    migrations = []
+    if os.path.isdir(MIGRATIONS_DIR):
+        for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+            match = _MIGRATION_FILE_RE.match(filename)
+            if match:
+                migrations.append((match.group(1), os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def split_statements(sql: str):
+    """Разбить SQL-скрипт на выражения по ';' с учетом блоков $$...$$"""
+    statements = []
+    current = []
+    in_dollar_block = False
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if not current and (not stripped or stripped.startswith("--")):
+            continue
+        current.append(line)
+        if stripped.count("$$") % 2 == 1:
+            in_dollar_block = not in_dollar_block
+        if not in_dollar_block and stripped.endswith(";"):
+            statements.append("\n".join(current))
+            current = []
+    if current and "\n".join(current).strip():
+        statements.append("\n".join(current))
+    return statements
+
+
+def _apply_initial_schema():
+    with engine.begin() as connection:
+        if not inspect(connection).has_table(models.User.__tablename__):
+            print("Создание начальной схемы по моделям...")
+            models.Base.metadata.create_all(bind=connection)
+        _record_version(connection, INITIAL_VERSION)
+
+
+def _apply_sql_migration(version: str, path: str):
+    with open(path, encoding="utf-8") as f:
+        sql = f.read()
+    
+    if NO_TRANSACTION_DIRECTIVE in sql:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            for statement in split_statements(sql):
+                connection.exec_driver_sql(statement)
+            _record_version(connection, version)
+    else:
+        with engine.begin() as connection:
+            connection.exec_driver_sql(sql)
+            _record_version(connection, version)
+
+
+def get_pending_migrations():
+    applied = get_applied_versions()
+    pending = [] if INITIAL_VERSION in applied else [(INITIAL_VERSION, None)]
+    pending.extend(
+        (version, path) for version, path in get_migration_files() if version not in applied
+    )
+    return pending
+
+
+def upgrade():
+    """Применить все неприменённые миграции; возвращает список версий"""
+    applied = []
+    for version, path in get_pending_migrations():
+        print(f"Применение миграции {version}...")
+        if path is None:
+            _apply_initial_schema()
+        else:
+            _apply_sql_migration(version, path)
+        applied.append(version)
+    return applied
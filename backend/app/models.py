@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Enum, DateTime, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, Enum, DateTime, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -21,7 +21,7 @@ class User(Base):
     max_points = Column(Integer, default=100)
     gold = Column(Integer, default=0)
     attack = Column(Integer, default=1)
-    team_id = Column(Integer, ForeignKey("teams.team_id"), nullable=True)
+    team_id = Column(Integer, ForeignKey("teams.team_id"), nullable=True, index=True)
     img = Column(String(255))
 
     # Relationships
@@ -50,6 +50,9 @@ class Item(Base):
 
 class UserItem(Base):
     __tablename__ = "user_items"
+    __table_args__ = (
+        Index("ix_user_items_user_id_active", "user_id", "active"),
+    )
 
     user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
     item_id = Column(Integer, ForeignKey("items.item_id"), primary_key=True)
@@ -80,6 +83,9 @@ class Team(Base):
     boss_id = Column(Integer, ForeignKey("bosses.boss_id"), nullable=True)
     boss_lives = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Счетчики для выбора босса, обновляются в тех же транзакциях, что и участники
+    member_count = Column(Integer, nullable=False, default=0, server_default="0")
+    level_sum = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relationships
     owner = relationship("User", foreign_keys=[owner_id], back_populates="owned_teams")
@@ -97,6 +103,8 @@ class Boss(Base):
     level = Column(Integer, default=1)
     gold_reward = Column(Integer, default=100)  # Добавлено поле для награды
     img_url = Column(String(255), nullable=True)  # Добавлено поле для изображения
+    # Минимальный средний уровень команды для этого босса (NULL - не участвует в подборе)
+    min_team_level = Column(Integer, nullable=True)
 
     # Relationships
     teams = relationship("Team", back_populates="boss")
@@ -105,7 +113,7 @@ class Catalog(Base):
     __tablename__ = "catalogs"
 
     catalog_id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False, index=True)
     name = Column(String(63), nullable=False)
 
     # Relationships
@@ -116,11 +124,14 @@ class Task(Base):
     __tablename__ = "tasks"
 
     task_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    catalog_id = Column(Integer, ForeignKey("catalogs.catalog_id"), nullable=False)
+    catalog_id = Column(Integer, ForeignKey("catalogs.catalog_id"), nullable=False, index=True)
     name = Column(String(127), nullable=False)
     complexity = Column(Enum('easy', 'normal', 'hard', name='task_complexity'), nullable=False)
     deadline = Column(Date, nullable=True)
     completed = Column(Enum('true', 'false', name='completed_status'), default='false', nullable=False)
+    # День последней выданной награды: обычная задача награждается один раз,
+    # задача с ежедневным расписанием - не чаще раза в календарный день
+    rewarded_on = Column(Date, nullable=True)
     
     # Relationships
     catalog = relationship("Catalog", back_populates="tasks")
@@ -128,6 +139,9 @@ class Task(Base):
 
 class DailyTask(Base):
     __tablename__ = "daily_task"
+    __table_args__ = (
+        Index("ix_daily_task_task_id_day_week", "task_id", "day_week"),
+    )
 
     daily_task_id = Column(Integer, primary_key=True, index=True)
     task_id = Column(Integer, ForeignKey("tasks.task_id"), nullable=False)
@@ -148,4 +162,7 @@ class ChatMessage(Base):
 
     # Relationships
     team = relationship("Team", back_populates="chat_messages")
-    user = relationship("User", back_populates="chat_messages")
\ No newline at end of file
+    user = relationship("User", back_populates="chat_messages")
+
+# История чата читается по команде с курсором по message_id
+Index("ix_chat_messages_team_id_message_id", ChatMessage.team_id, ChatMessage.message_id)
\ No newline at end of file
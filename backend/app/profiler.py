@@ -0,0 +1,128 @@
+"""Профилировщик SQL для разработки (включается переменной SQL_PROFILE=1).
+
+Считает запросы в рамках HTTP-запроса, группирует их по нормализованному
+тексту, помечает повторяющиеся выражения как вероятный N+1 и добавляет к
+ответу заголовки X-Query-Count и Server-Timing.
+
+В тестах:
+    assert int(response.headers["x-query-count"]) <= 5
+или для прямых вызовов crud:
+    with assert_max_queries(3):
+        crud.defeat_boss(db, team_id)
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+import os
+import re
+import time
+
+from sqlalchemy import event
+
+SQL_PROFILE_ENABLED = os.getenv("SQL_PROFILE", "false").lower() in ("1", "true")
+# Сколько одинаковых выражений за запрос считать N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_PROFILE_N_PLUS_ONE_THRESHOLD", "3"))
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%\(\w+\)s|\$\d+|(?<!:):\w+|\?")
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """Привести SQL к шаблону: литералы и параметры заменяются на '?'"""
+    statement = _STRING_RE.sub("?", statement)
+    statement = _PARAM_RE.sub("?", statement)
+    statement = _NUMBER_RE.sub("?", statement)
+    statement = _IN_LIST_RE.sub("IN (?)", statement)
+    return _SPACE_RE.sub(" ", statement).strip()
+
+
+class QueryProfile:
+    def __init__(self):
+        self.statements = Counter()
+        self.count = 0
+        self.seconds = 0.0
+
+    def record(self, statement: str, seconds: float):
+        self.statements[normalize_statement(statement)] += 1
+        self.count += 1
+        self.seconds += seconds
+
+    def repeated_statements(self, threshold: int = N_PLUS_ONE_THRESHOLD):
+        """Выражения, выполненные threshold и более раз (вероятный N+1)"""
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+current_profile: ContextVar = ContextVar("current_query_profile", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profile_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["profile_start_time"].pop()
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record(statement, time.perf_counter() - started)
+
+
+def instrument_engine(sync_engine):
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def profile_queries():
+    """Собрать профиль запросов, выполненных внутри блока"""
+    profile = QueryProfile()
+    token = current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        current_profile.reset(token)
+
+
+@contextmanager
+def assert_max_queries(max_queries: int):
+    """Упасть, если внутри блока выполнено больше max_queries запросов"""
+    with profile_queries() as profile:
+        yield profile
+    if profile.count > max_queries:
+        details = "\n".join(f"  {count}x {statement}" for statement, count in profile.statements.most_common())
+        raise AssertionError(f"Expected at most {max_queries} queries, got {profile.count}:\n{details}")
+
+
+class QueryProfilerMiddleware:
+    """ASGI middleware: профиль SQL на каждый HTTP-запрос и заголовки с итогами"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        profile = QueryProfile()
+        token = current_profile.set(profile)
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(profile.count).encode()))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={profile.seconds * 1000:.2f};desc="{profile.count} queries"'.encode()
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            for statement, count in profile.repeated_statements():
+                print(f"[SQL N+1] {scope['method']} {scope['path']}: {count}x {statement}")
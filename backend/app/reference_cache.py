@@ -0,0 +1,99 @@
+"""Кэш ответов справочников (предметы, классы, боссы).
+
+Справочники меняются только при создании записей и невелики, поэтому каждый
+хранится целиком: одна запись на вид справочника, строки уже сериализованы
+в JSON. Ответ на запрос со skip/limit собирается срезом готовых строк, его
+строгий ETag выводится из хэша всего справочника и границ среза, а клиент
+с актуальной копией получает 304. Запросы к БД и сериализация строк
+выполняются только при промахе.
+
+Записи сбрасываются invalidate(kind) при изменении справочника на этом воркере
+и по событию из broadcast на остальных; REFERENCE_CACHE_TTL ограничивает
+устаревание, если данные поменялись в обход API (init-скрипты, SQL).
+"""
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+import hashlib
+import json
+import os
+import threading
+import time
+
+from fastapi import Request, Response, status
+
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+REFERENCE_CACHE_MAX_AGE = int(os.getenv("REFERENCE_CACHE_MAX_AGE", "60"))
+
+
+class ReferenceEntry(NamedTuple):
+    rows: Tuple[bytes, ...]
+    digest: str
+    loaded_at: float
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match сравнивается слабо: префикс W/ не учитывается
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return etag in [value[2:] if value.startswith("W/") else value for value in candidates]
+
+
+def _build_entry(rows: list) -> ReferenceEntry:
+    encoded = tuple(
+        json.dumps(row, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        for row in rows
+    )
+    digest = hashlib.sha1(b"\n".join(encoded)).hexdigest()
+    return ReferenceEntry(encoded, digest, time.monotonic())
+
+
+class ReferenceDataCache:
+    def __init__(self, ttl: float = REFERENCE_CACHE_TTL, max_age: int = REFERENCE_CACHE_MAX_AGE):
+        self.ttl = ttl
+        self.max_age = max_age
+        self._entries: Dict[str, ReferenceEntry] = {}
+        # Номер версии справочника: загрузка, начатая до invalidate(), не сохраняется
+        self._generations: Dict[str, int] = {}
+        self._hooks: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def on_invalidate(self, kind: str, hook: Callable[[], None]):
+        """Дополнительный сброс (например, каталога боссов) вместе со справочником"""
+        self._hooks.setdefault(kind, []).append(hook)
+
+    def invalidate(self, kind: str):
+        with self._lock:
+            self._entries.pop(kind, None)
+            self._generations[kind] = self._generations.get(kind, 0) + 1
+        for hook in self._hooks.get(kind, []):
+            hook()
+
+    def get(self, kind: str, loader: Callable[[], list]) -> ReferenceEntry:
+        """Весь справочник kind; loader вызывается без блокировки только при промахе"""
+        entry = self._entries.get(kind)
+        if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+            return entry
+        generation = self._generations.get(kind, 0)
+        entry = _build_entry(loader())
+        with self._lock:
+            if self._generations.get(kind, 0) == generation:
+                self._entries[kind] = entry
+        return entry
+
+    def response(
+        self, request: Request, kind: str, loader: Callable[[], list], skip: int = 0, limit: Optional[int] = None
+    ) -> Response:
+        """Срез справочника со строгим ETag; 304, если у клиента та же версия"""
+        entry = self.get(kind, loader)
+        skip = max(skip, 0)
+        stop = None if limit is None else skip + max(limit, 0)
+        etag = f'"{entry.digest}-{skip}-{"" if stop is None else stop}"'
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={self.max_age}"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        body = b"[" + b",".join(entry.rows[skip:stop]) + b"]"
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+reference_cache = ReferenceDataCache()
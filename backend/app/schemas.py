@@ -152,6 +152,7 @@ class BossBase(BaseModel):
     level: int = 1
     gold_reward: int = 100
     img_url: Optional[str] = None
+    min_team_level: Optional[int] = None
 
 class BossCreate(BossBase):
     pass
@@ -197,6 +198,8 @@ class TeamResponse(BaseModel):
     boss: Optional[Boss] = None
     owner: Optional[UserSimple] = None
     members: List[UserSimple] = []
+    member_count: int = 0
+    average_level: float = 0
 
     class Config:
         from_attributes = True
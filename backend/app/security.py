@@ -2,7 +2,10 @@ from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from typing import Union, Any
 from jose import jwt
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
+import threading
 
 # Configuration for JWT
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # 30 minutes
@@ -19,6 +22,36 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+# Пул потоков для bcrypt: хеширование не блокирует event loop и ограничено по нагрузке
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "1"))  # секунды
+
+_password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+# Выполняемые + ожидающие задачи пула
+_password_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT)
+
+class PasswordHasherBusy(Exception):
+    """Пул хеширования паролей переполнен"""
+    retry_after = PASSWORD_HASH_RETRY_AFTER
+
+async def _run_password_job(func, *args):
+    if not _password_slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, func, *args)
+    finally:
+        _password_slots.release()
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_password_job(get_password_hash, password)
+
 def create_access_token(subject: Union[str, Any], expires_delta: timedelta = None) -> str:
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
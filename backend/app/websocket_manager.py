@@ -0,0 +1,219 @@
+"""Менеджер WebSocket-соединений командного чата.
+
+У каждого соединения своя ограниченная очередь исходящих сообщений и своя
+задача-писатель, поэтому рассылка не ждет медленных клиентов: сообщение
+только кладется в очереди. При переполнении очереди отбрасываются самые
+старые сообщения, а клиент, потерявший слишком много подряд (без единой
+успешной отправки между потерями), отключается.
+
+Очередь хранит события-конверты (см. ws_protocol); писатель забирает все
+накопившиеся события и отправляет их одним кадром в формате клиента.
+
+Частые события состояния (здоровье босса, изменения участников, присутствие)
+не рассылаются сразу, а схлопываются: за окно TEAM_EVENT_INTERVAL_MS клиент
+получит только последнее значение по каждому ключу. Прочие события
+(чат, победа над боссом) доставляются сразу, предварительно отправив
+накопленное, чтобы не нарушить порядок.
+"""
+from typing import Any, Dict
+import asyncio
+import os
+
+from fastapi import WebSocket, status
+
+from . import ws_protocol
+from .broadcast import broadcast
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+# Сколько сообщений подряд можно потерять, прежде чем медленный клиент будет отключен
+WS_MAX_DROPPED_MESSAGES = int(os.getenv("WS_MAX_DROPPED_MESSAGES", "200"))
+# Окно микробатчинга: сколько писатель ждет новые события перед отправкой кадра
+WS_BATCH_WINDOW_MS = int(os.getenv("WS_BATCH_WINDOW_MS", "10"))
+WS_BATCH_MAX_EVENTS = int(os.getenv("WS_BATCH_MAX_EVENTS", "50"))
+# Не чаще одного события состояния на ключ за это окно (250 мс - 4 в секунду)
+TEAM_EVENT_INTERVAL_MS = int(os.getenv("TEAM_EVENT_INTERVAL_MS", "250"))
+
+# Служебное событие между воркерами: +1/-1 открытый сокет участника
+PRESENCE_DELTA = "presence_delta"
+
+
+def _coalesce_key(event: dict):
+    """Ключ схлопывания события или None, если событие доставляется сразу"""
+    event_type = event.get("type")
+    if event_type == ws_protocol.EVENT_BOSS_HP:
+        return (event_type,)
+    if event_type in (ws_protocol.EVENT_MEMBER, ws_protocol.EVENT_PRESENCE):
+        return (event_type, event.get("user_id"))
+    return None
+
+
+class TeamConnection:
+    def __init__(self, websocket: WebSocket, user_id: int = None, frame_format: str = ws_protocol.FORMAT_JSON):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.frame_format = frame_format
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        # Потеряно с последней успешной отправки; сбрасывается, когда клиент догоняет
+        self.dropped = 0
+        self.closed = False
+        self._writer = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def stop(self):
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+
+    def enqueue(self, event: dict) -> bool:
+        """Поставить событие в очередь; False - клиент слишком медленный"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Отбрасываем самое старое событие
+            self.queue.get_nowait()
+            self.queue.put_nowait(event)
+            self.dropped += 1
+            if self.dropped > WS_MAX_DROPPED_MESSAGES:
+                return False
+        return True
+
+    async def _write_loop(self):
+        try:
+            while True:
+                events = [await self.queue.get()]
+                if WS_BATCH_WINDOW_MS > 0:
+                    await asyncio.sleep(WS_BATCH_WINDOW_MS / 1000)
+                while len(events) < WS_BATCH_MAX_EVENTS and not self.queue.empty():
+                    events.append(self.queue.get_nowait())
+                
+                frame = ws_protocol.encode_frame(events, self.frame_format)
+                if isinstance(frame, bytes):
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+                self.dropped = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Сокет закрыт: обработчик соединения сам вызовет disconnect
+            print(f"WebSocket writer stopped: {e}")
+            self.closed = True
+
+
+class TeamConnectionManager:
+    def __init__(self):
+        self.active_connections: Dict[int, Dict[WebSocket, TeamConnection]] = {}
+        # Схлопываемые события, ожидающие отправки: team_id -> ключ -> событие
+        self._pending: Dict[int, Dict[tuple, dict]] = {}
+        # Число открытых сокетов участников по всем воркерам: team_id -> user_id -> count
+        self._presence: Dict[int, Dict[int, int]] = {}
+    
+    async def connect(
+        self, websocket: WebSocket, team_id: int, user_id: int = None,
+        frame_format: str = ws_protocol.FORMAT_JSON
+    ):
+        await websocket.accept()
+        connection = TeamConnection(websocket, user_id, frame_format)
+        connection.start()
+        self.active_connections.setdefault(team_id, {})[websocket] = connection
+        
+        if user_id is not None:
+            # Новому клиенту - снимок присутствия, остальным - что участник в сети
+            online = set(self.get_online_users(team_id)) | {user_id}
+            connection.enqueue(ws_protocol.make_event(ws_protocol.EVENT_PRESENCE, online=sorted(online)))
+            await self._publish_presence(team_id, user_id, 1)
+    
+    def disconnect(self, websocket: WebSocket, team_id: int):
+        connections = self.active_connections.get(team_id)
+        if connections is None:
+            return
+        connection = connections.pop(websocket, None)
+        if connection is not None:
+            connection.stop()
+            if connection.user_id is not None:
+                asyncio.ensure_future(self._publish_presence(team_id, connection.user_id, -1))
+        if not connections:
+            del self.active_connections[team_id]
+    
+    def get_online_users(self, team_id: int):
+        return [user_id for user_id, count in self._presence.get(team_id, {}).items() if count > 0]
+    
+    async def _publish_presence(self, team_id: int, user_id: int, delta: int):
+        await broadcast.publish({
+            "team_id": team_id,
+            "event": {"type": PRESENCE_DELTA, "user_id": user_id, "delta": delta}
+        })
+    
+    async def send_to_team(self, event: dict, team_id: int):
+        """Разослать событие участникам команды, подключенным к любому воркеру"""
+        await broadcast.publish({"team_id": team_id, "event": event})
+    
+    async def deliver_local(self, event: Dict[str, Any]):
+        """Доставить событие из broadcast сокетам этого воркера (без ожидания отправки)"""
+        team_id = event["team_id"]
+        team_event = event["event"]
+        if team_event.get("type") == PRESENCE_DELTA:
+            team_event = self._apply_presence(team_id, team_event)
+            if team_event is None:
+                return
+        
+        key = _coalesce_key(team_event)
+        if key is None:
+            self._flush_team(team_id)
+            self._enqueue_local(team_id, team_event)
+            return
+        
+        pending = self._pending.get(team_id)
+        if pending is None:
+            pending = self._pending[team_id] = {}
+            asyncio.get_running_loop().call_later(
+                TEAM_EVENT_INTERVAL_MS / 1000, self._flush_team, team_id
+            )
+        # Изменения одного участника объединяются в один diff
+        pending[key] = {**pending.get(key, {}), **team_event}
+    
+    def _apply_presence(self, team_id: int, delta_event: dict):
+        """Учесть открытие/закрытие сокета; событие для клиентов, если статус изменился"""
+        counts = self._presence.setdefault(team_id, {})
+        user_id = delta_event["user_id"]
+        was_online = counts.get(user_id, 0) > 0
+        count = max(counts.get(user_id, 0) + delta_event["delta"], 0)
+        if count:
+            counts[user_id] = count
+        else:
+            counts.pop(user_id, None)
+            if not counts:
+                del self._presence[team_id]
+        if was_online == (count > 0):
+            return None
+        return ws_protocol.make_event(ws_protocol.EVENT_PRESENCE, user_id=user_id, online=count > 0)
+    
+    def _flush_team(self, team_id: int):
+        pending = self._pending.pop(team_id, None)
+        if pending:
+            for team_event in pending.values():
+                self._enqueue_local(team_id, team_event)
+    
+    def _enqueue_local(self, team_id: int, team_event: dict):
+        for websocket, connection in list(self.active_connections.get(team_id, {}).items()):
+            if not connection.enqueue(team_event):
+                self._drop_slow_consumer(websocket, team_id)
+    
+    def _drop_slow_consumer(self, websocket: WebSocket, team_id: int):
+        print(f"Dropping slow WebSocket consumer in team {team_id}")
+        self.disconnect(websocket, team_id)
+        asyncio.ensure_future(self._close_quietly(websocket))
+    
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        except Exception:
+            pass
+
+
+team_manager = TeamConnectionManager()
@@ -0,0 +1,90 @@
+"""Протокол сообщений командного WebSocket.
+
+Каждое событие - словарь-конверт {"v": версия, "type": тип, ...поля}.
+Несколько событий, накопившихся в очереди соединения, уходят одним кадром
+{"v": ..., "type": "batch", "events": [...]}. Кадр кодируется в JSON (текст)
+или, если клиент подключился с ?format=msgpack и установлен пакет msgpack,
+в MessagePack (бинарный кадр). Сжатие кадров - permessage-deflate, его
+согласует uvicorn (включено по умолчанию, --ws-per-message-deflate).
+"""
+from datetime import datetime
+import json
+
+try:
+    import msgpack  # опциональная зависимость
+except ImportError:
+    msgpack = None
+
+PROTOCOL_VERSION = 1
+
+EVENT_CHAT = "chat"
+EVENT_PRESENCE = "presence"
+EVENT_BOSS_HP = "boss_hp"
+EVENT_BOSS = "boss"
+EVENT_BOSS_DEFEATED = "boss_defeated"
+EVENT_MEMBER = "member"
+EVENT_MEMBER_LEFT = "member_left"
+EVENT_REWARD = "reward"
+EVENT_BATCH = "batch"
+
+FORMAT_JSON = "json"
+FORMAT_MSGPACK = "msgpack"
+
+
+def make_event(event_type: str, **fields) -> dict:
+    return {"v": PROTOCOL_VERSION, "type": event_type, **fields}
+
+
+def envelope(event: dict) -> dict:
+    """Обернуть событие crud ({"type": ..., ...}) в конверт текущей версии"""
+    return {"v": PROTOCOL_VERSION, **event}
+
+
+def chat_event(user_id: int, nickname: str, text: str) -> dict:
+    return make_event(
+        EVENT_CHAT, user_id=user_id, nickname=nickname, text=text,
+        ts=datetime.utcnow().isoformat()
+    )
+
+
+def negotiate_format(requested: str) -> str:
+    """Формат кадров для клиента; без msgpack всегда JSON"""
+    if requested == FORMAT_MSGPACK and msgpack is not None:
+        return FORMAT_MSGPACK
+    return FORMAT_JSON
+
+
+def encode_frame(events: list, frame_format: str = FORMAT_JSON):
+    """Закодировать одно или несколько событий в кадр (str для JSON, bytes для msgpack)"""
+    payload = events[0] if len(events) == 1 else make_event(EVENT_BATCH, events=events)
+    if frame_format == FORMAT_MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_chat_text(text: str = None, data: bytes = None):
+    """Текст сообщения чата от клиента.
+
+    Принимается простой текст (прежние клиенты) или конверт {"type": "chat", "text": ...}
+    в JSON либо MessagePack. Для прочих сообщений возвращается None.
+    """
+    payload = None
+    if data is not None:
+        if msgpack is None:
+            return None
+        try:
+            payload = msgpack.unpackb(data, raw=False)
+        except Exception:
+            return None
+    elif text is not None:
+        if not text.startswith("{"):
+            return text
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            return text
+        if not isinstance(payload, dict) or "type" not in payload:
+            return text
+    if isinstance(payload, dict) and payload.get("type") == EVENT_CHAT and isinstance(payload.get("text"), str):
+        return payload["text"]
+    return None
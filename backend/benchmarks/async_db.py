@@ -0,0 +1,39 @@
+# Пропускная способность одного воркера на эндпоинтах с запросами к БД.
+# Запуск: uvicorn app.main:app --workers 1, затем
+#   python benchmarks/async_db.py --login user --password secret
+# Сравнение "до/после" - запуск на двух версиях сервера с одинаковыми параметрами.
+
+import argparse
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from load import get_token, report, run_load
+
+ENDPOINTS = ["/api/users/me", "/api/user-items", "/api/catalogs/"]
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        headers = {"Authorization": f"Bearer {await get_token(client, args.login, args.password)}"}
+        for path in args.endpoints or ENDPOINTS:
+            latencies, errors, seconds = await run_load(
+                client, lambda client: client.get(path, headers=headers), args.concurrency, args.requests
+            )
+            report(path, latencies, seconds, errors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RPS эндпоинтов с БД на одном воркере")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--login", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=200, help="Одновременных запросов")
+    parser.add_argument("--requests", type=int, default=5000, help="Запросов на эндпоинт")
+    parser.add_argument("--endpoints", nargs="*", help="Пути вместо набора по умолчанию")
+    asyncio.run(main(parser.parse_args()))
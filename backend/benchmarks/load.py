@@ -0,0 +1,58 @@
+"""Общие функции нагрузочных замеров: N одновременных клиентов, RPS и перцентили задержки"""
+import asyncio
+import time
+
+import httpx
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def report(title: str, latencies, seconds: float, errors: int = 0):
+    print(
+        f"{title}: {len(latencies)} запросов за {seconds:.2f} с, {len(latencies) / seconds:.0f} RPS, "
+        f"p50 {percentile(latencies, 0.5) * 1000:.1f} мс, p99 {percentile(latencies, 0.99) * 1000:.1f} мс, "
+        f"ошибок {errors}"
+    )
+
+
+async def run_load(client: httpx.AsyncClient, request, concurrency: int, total: int = None, stop: asyncio.Event = None):
+    """Выполнять request(client) в concurrency потоков: total раз или до stop.
+
+    Возвращает (задержки успешных запросов, число ошибок, длительность).
+    """
+    latencies = []
+    errors = 0
+    remaining = [total]
+    
+    async def worker():
+        nonlocal errors
+        while not (stop is not None and stop.is_set()):
+            if total is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                response = await request(client)
+                if response.status_code >= 500:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def get_token(client: httpx.AsyncClient, login: str, password: str) -> str:
+    response = await client.post("/api/auth/token", data={"username": login, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
@@ -0,0 +1,51 @@
+# Задержка обычных эндпоинтов во время массового входа (bcrypt в отдельном пуле).
+# Запуск: uvicorn app.main:app --workers 1, затем
+#   python benchmarks/login_storm.py --login user --password secret
+# Во время шторма часть входов получает 503 с Retry-After - это ожидаемо.
+
+import argparse
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from load import get_token, report, run_load
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.logins + args.readers)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        headers = {"Authorization": f"Bearer {await get_token(client, args.login, args.password)}"}
+        
+        def read(client):
+            return client.get(args.endpoint, headers=headers)
+        
+        def login(client):
+            return client.post("/api/auth/token", data={"username": args.login, "password": args.password})
+        
+        latencies, errors, seconds = await run_load(client, read, args.readers, args.requests)
+        report(f"{args.endpoint} без нагрузки", latencies, seconds, errors)
+        
+        stop = asyncio.Event()
+        storm = asyncio.create_task(run_load(client, login, args.logins, stop=stop))
+        latencies, errors, seconds = await run_load(client, read, args.readers, args.requests)
+        stop.set()
+        report(f"{args.endpoint} во время входа", latencies, seconds, errors)
+        
+        logins, login_errors, login_seconds = await storm
+        report("/api/auth/token (успешные и 503)", logins, login_seconds, login_errors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="p99 эндпоинтов во время шторма входов")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--login", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--endpoint", default="/api/users/me", help="Замеряемый эндпоинт")
+    parser.add_argument("--logins", type=int, default=100, help="Одновременных входов")
+    parser.add_argument("--readers", type=int, default=20, help="Одновременных запросов к эндпоинту")
+    parser.add_argument("--requests", type=int, default=2000, help="Запросов к эндпоинту на замер")
+    asyncio.run(main(parser.parse_args()))
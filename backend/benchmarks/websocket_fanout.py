@@ -0,0 +1,97 @@
+# Рассылка события в чат команды на много сокетов одного воркера, в том числе
+# при нескольких зависших клиентах. Сервер и БД не нужны: сокеты поддельные.
+# Запуск: python benchmarks/websocket_fanout.py --sockets 1000 --stalled 5
+# Ожидается: задержка доставки быстрым клиентам не растет из-за зависших,
+# а зависшие отключаются с кодом 1013 после WS_MAX_DROPPED_MESSAGES потерь подряд.
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load import percentile
+
+from app import ws_protocol
+from app.websocket_manager import TeamConnectionManager
+
+TEAM_ID = 1
+
+
+class FakeSocket:
+    def __init__(self, received_at: dict = None, stalled: bool = False):
+        self.received_at = received_at
+        self.stalled = stalled
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame: str):
+        if self.stalled:
+            await asyncio.Event().wait()
+        payload = json.loads(frame)
+        events = payload["events"] if payload["type"] == ws_protocol.EVENT_BATCH else [payload]
+        now = time.perf_counter()
+        for event in events:
+            self.received_at.setdefault(event["text"], []).append(now)
+
+    async def close(self, code: int):
+        self.close_code = code
+
+
+async def run(sockets: int, stalled: int, events: int, interval: float):
+    manager = TeamConnectionManager()
+    received_at = {}
+    fast = [FakeSocket(received_at) for _ in range(sockets)]
+    slow = [FakeSocket(stalled=True) for _ in range(stalled)]
+    for websocket in fast + slow:
+        await manager.connect(websocket, TEAM_ID)
+    
+    sent_at = {}
+    fanout = []
+    started = time.perf_counter()
+    for number in range(events):
+        event = {"team_id": TEAM_ID, "event": ws_protocol.chat_event(1, "bench", str(number))}
+        sent_at[str(number)] = time.perf_counter()
+        await manager.deliver_local(event)
+        fanout.append(time.perf_counter() - sent_at[str(number)])
+        await asyncio.sleep(interval)
+    
+    # Даем писателям доставить остаток
+    while sum(len(times) for times in received_at.values()) < sockets * events:
+        if time.perf_counter() - started > 60:
+            break
+        await asyncio.sleep(0.01)
+    seconds = time.perf_counter() - started
+    
+    delivery = [at - sent_at[text] for text, times in received_at.items() for at in times]
+    lost = sockets * events - len(delivery)
+    dropped = sum(1 for websocket in slow if websocket.close_code == 1013)
+    print(
+        f"{sockets} быстрых + {stalled} зависших, {events} событий за {seconds:.2f} с: "
+        f"постановка в очереди p50 {percentile(fanout, 0.5) * 1000:.2f} мс, p99 {percentile(fanout, 0.99) * 1000:.2f} мс; "
+        f"доставка p50 {percentile(delivery, 0.5) * 1000:.1f} мс, p99 {percentile(delivery, 0.99) * 1000:.1f} мс; "
+        f"потеряно быстрыми {lost}, отключено зависших {dropped}/{stalled}"
+    )
+    
+    for websocket in list(manager.active_connections.get(TEAM_ID, {})):
+        manager.disconnect(websocket, TEAM_ID)
+
+
+async def main(args):
+    await run(args.sockets, 0, args.events, args.interval)
+    await run(args.sockets, args.stalled, args.events, args.interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Рассылка события в чат команды на много сокетов")
+    parser.add_argument("--sockets", type=int, default=1000, help="Быстрых клиентов")
+    parser.add_argument("--stalled", type=int, default=5, help="Зависших клиентов")
+    parser.add_argument("--events", type=int, default=500, help="Событий чата")
+    parser.add_argument("--interval", type=float, default=0.002, help="Пауза между событиями, с")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,42 @@
+# Обслуживание истории чата: python chat_maintenance.py [partitions|archive]
+# Запускать по расписанию (cron), например раз в сутки.
+
+import argparse
+import os
+import sys
+
+# Добавляем путь к текущей директории для импорта app
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import chat_retention
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание истории чата Gamify Planner")
+    parser.add_argument(
+        "command", choices=["partitions", "archive"],
+        help="partitions - создать месячные секции заранее, archive - архивировать старые сообщения"
+    )
+    parser.add_argument("--months-ahead", type=int, default=3, help="На сколько месяцев вперед создавать секции")
+    parser.add_argument("--older-than-months", type=int, default=6, help="Возраст сообщений для архивации")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Размер пачки переноса без секционирования")
+    args = parser.parse_args()
+
+    if args.command == "partitions":
+        created = chat_retention.create_monthly_partitions(args.months_ahead)
+        for name in created:
+            print(f"Создана секция: {name}")
+        if not created:
+            print("Новых секций нет")
+        return
+
+    archived = chat_retention.archive_old_messages(args.older_than_months, args.batch_size)
+    if isinstance(archived, list):
+        for name in archived:
+            print(f"Секция отсоединена в архив: {name}")
+        if not archived:
+            print("Нет секций для архивации")
+    else:
+        print(f"Перенесено в архив сообщений: {archived}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# Проверка счетчиков команд: python check_team_stats.py [--fix]
+# Пересчитывает member_count/level_sum по пользователям и сообщает о расхождениях.
+
+import argparse
+import os
+import sys
+
+# Добавляем путь к текущей директории для импорта app
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import crud
+from app.database import SessionLocal
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка счетчиков участников и уровней команд")
+    parser.add_argument("--fix", action="store_true", help="Перезаписать счетчики фактическими значениями")
+    args = parser.parse_args()
+    
+    db = SessionLocal()
+    try:
+        drift = crud.check_team_stats(db, fix=args.fix)
+    finally:
+        db.close()
+    
+    if not drift:
+        print("Счетчики всех команд совпадают с участниками")
+        return
+    
+    for row in drift:
+        print(
+            f"Команда {row.team_id}: member_count {row.member_count} -> {row.actual_count}, "
+            f"level_sum {row.level_sum} -> {row.actual_sum}"
+        )
+    if args.fix:
+        print(f"Исправлено команд: {len(drift)}")
+    else:
+        print(f"Расхождений: {len(drift)} (запустите с --fix для исправления)")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# CLI миграций схемы БД: python migrate.py [upgrade|status]
+
+import argparse
+import os
+import sys
+
+# Добавляем путь к текущей директории для импорта app
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import migrations
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы БД Gamify Planner")
+    parser.add_argument(
+        "command", nargs="?", default="upgrade", choices=["upgrade", "status"],
+        help="upgrade - применить новые миграции, status - показать неприменённые"
+    )
+    args = parser.parse_args()
+    
+    if args.command == "status":
+        pending = migrations.get_pending_migrations()
+        if not pending:
+            print("Схема БД в актуальном состоянии")
+        for version, _ in pending:
+            print(f"Не применена: {version}")
+        return
+    
+    applied = migrations.upgrade()
+    if applied:
+        print(f"Применено миграций: {len(applied)}")
+    else:
+        print("Новых миграций нет")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+-- Индексы под реальные фильтры запросов crud.py
+-- CONCURRENTLY не блокирует запись в таблицы, но не может выполняться в транзакции
+-- migrate: no-transaction
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tasks_catalog_id ON tasks (catalog_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_catalogs_user_id ON catalogs (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_team_id ON users (team_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_daily_task_task_id_day_week ON daily_task (task_id, day_week);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_items_user_id_active ON user_items (user_id, active);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_messages_team_id_timestamp ON chat_messages (team_id, timestamp DESC);
@@ -0,0 +1,5 @@
+-- История чата пагинируется курсором по message_id внутри команды
+-- migrate: no-transaction
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_messages_team_id_message_id ON chat_messages (team_id, message_id);
+DROP INDEX CONCURRENTLY IF EXISTS ix_chat_messages_team_id_timestamp;
@@ -0,0 +1,8 @@
+-- Счетчики участников и суммы уровней команды для выбора босса без обхода участников
+
+ALTER TABLE teams ADD COLUMN IF NOT EXISTS member_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE teams ADD COLUMN IF NOT EXISTS level_sum INTEGER NOT NULL DEFAULT 0;
+
+UPDATE teams SET
+    member_count = (SELECT count(*) FROM users WHERE users.team_id = teams.team_id),
+    level_sum = (SELECT COALESCE(sum(level), 0) FROM users WHERE users.team_id = teams.team_id);
@@ -0,0 +1,15 @@
+-- Уровни сложности боссов хранятся в данных, а не в коде (см. app/boss_catalog.py)
+
+ALTER TABLE bosses ADD COLUMN IF NOT EXISTS min_team_level INTEGER;
+
+UPDATE bosses SET min_team_level = CASE boss_id
+    WHEN 1 THEN 0
+    WHEN 2 THEN 11
+    WHEN 3 THEN 21
+    WHEN 4 THEN 31
+    WHEN 5 THEN 41
+    WHEN 6 THEN 51
+    WHEN 7 THEN 61
+    WHEN 8 THEN 71
+END
+WHERE min_team_level IS NULL AND boss_id BETWEEN 1 AND 8;
@@ -0,0 +1,6 @@
+-- День последней награды за задачу: повторная отметка не начисляет награду дважды
+
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS rewarded_on DATE;
+
+-- Уже выполненные задачи считаются награжденными сегодня
+UPDATE tasks SET rewarded_on = CURRENT_DATE WHERE completed = 'true' AND rewarded_on IS NULL;
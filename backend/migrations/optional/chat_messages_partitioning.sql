@@ -0,0 +1,53 @@
+-- Необязательно: помесячное секционирование chat_messages по timestamp.
+-- Не применяется автоматически (migrate.py читает только migrations/NNNN_*.sql).
+-- Выполнять вручную в окно обслуживания: psql -f chat_messages_partitioning.sql
+-- Дальнейшие секции создаются по расписанию: python chat_maintenance.py partitions
+
+BEGIN;
+
+ALTER TABLE chat_messages RENAME TO chat_messages_legacy;
+ALTER INDEX IF EXISTS ix_chat_messages_team_id_message_id RENAME TO ix_chat_messages_legacy_team_id_message_id;
+
+CREATE TABLE chat_messages (
+    message_id INTEGER NOT NULL DEFAULT nextval('chat_messages_message_id_seq'),
+    team_id INTEGER NOT NULL REFERENCES teams (team_id),
+    user_id INTEGER NOT NULL REFERENCES users (user_id),
+    message TEXT NOT NULL,
+    timestamp TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (message_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Месячные секции на весь период старых сообщений и на 3 месяца вперед,
+-- чтобы перенесенные строки не попали в секцию по умолчанию
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            (SELECT date_trunc('month', COALESCE(MIN(timestamp), now())) FROM chat_messages_legacy),
+            date_trunc('month', now()) + interval '3 months',
+            interval '1 month'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF chat_messages FOR VALUES FROM (%L) TO (%L)',
+            'chat_messages_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM'),
+            month, (month + interval '1 month')::date
+        );
+    END LOOP;
+END $$;
+
+-- Сообщения вне созданных месячных секций
+CREATE TABLE chat_messages_default PARTITION OF chat_messages DEFAULT;
+
+INSERT INTO chat_messages (message_id, team_id, user_id, message, timestamp)
+SELECT message_id, team_id, user_id, message, COALESCE(timestamp, now())
+FROM chat_messages_legacy;
+
+ALTER SEQUENCE chat_messages_message_id_seq OWNED BY chat_messages.message_id;
+DROP TABLE chat_messages_legacy;
+
+CREATE INDEX ix_chat_messages_team_id_message_id ON chat_messages (team_id, message_id);
+
+COMMIT;
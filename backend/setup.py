@@ -6,6 +6,7 @@ import sys
 # Добавляем путь к текущей директории для импорта app
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from app import migrations
 from app.init_bosses import init_bosses
 from app.init_classes import init_classes
 from app.init_items import init_items
@@ -21,6 +22,10 @@ def setup_project():
     else:
         print(f"Директория для чатов уже существует: {chat_dir}")
     
+    # Схема БД должна быть актуальной до заполнения данными
+    print("=== Миграции схемы БД ===")
+    migrations.upgrade()
+    
     # Инициализируем базовые данные в правильном порядке
     print("=== Инициализация базовых данных ===")
     
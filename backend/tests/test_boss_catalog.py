@@ -0,0 +1,131 @@
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import boss_catalog, models
+from app.boss_catalog import BossCatalog, BossInfo, find_boss, get_boss_catalog
+from app.init_bosses import BOSSES_DATA
+
+
+def _boss(boss_id, min_team_level):
+    return BossInfo(boss_id, f"Босс {boss_id}", 100, None, 1, 10, None, min_team_level)
+
+
+def _legacy_boss_id(avg_level):
+    """Прежняя лестница выбора босса: до 10 - первый, далее по десяткам, выше 70 - восьмой"""
+    if avg_level <= 10:
+        return 1
+    return min((avg_level - 1) // 10 + 1, 8)
+
+
+@pytest.fixture
+def seeded_catalog():
+    return BossCatalog([BossInfo(**{field: data.get(field) for field in BossInfo._fields}) for data in BOSSES_DATA])
+
+
+def test_seed_data_matches_legacy_ladder(seeded_catalog):
+    for avg_level in range(0, 120):
+        assert seeded_catalog.for_level(avg_level).boss_id == _legacy_boss_id(avg_level), avg_level
+
+
+def test_for_level_below_first_tier_returns_first_boss():
+    catalog = BossCatalog([_boss(1, 5), _boss(2, 10)])
+    assert catalog.for_level(0).boss_id == 1
+    assert catalog.for_level(9.5).boss_id == 1
+    assert catalog.for_level(10).boss_id == 2
+
+
+def test_bosses_without_min_level_are_not_selected():
+    catalog = BossCatalog([_boss(1, 0), _boss(2, None), _boss(3, 20)])
+    assert [catalog.for_level(level).boss_id for level in (0, 19, 20)] == [1, 1, 3]
+    assert catalog.get(2).boss_id == 2
+    assert len(catalog) == 3
+
+
+def test_same_tier_prefers_lower_boss_id():
+    catalog = BossCatalog([_boss(7, 0), _boss(4, 0)])
+    assert catalog.for_level(50).boss_id == 4
+
+
+def test_empty_catalog():
+    catalog = BossCatalog([_boss(1, None)])
+    assert catalog.for_level(10) is None
+
+
+@pytest.fixture
+def catalog_loads(sqlite_engine, monkeypatch):
+    """Каталог процесса поверх SQLite; список - сколько раз читалась таблица bosses"""
+    loads = []
+    load = boss_catalog.load_boss_catalog
+    
+    def counting_load(db, version=0):
+        loads.append(version)
+        return load(db, version)
+    
+    monkeypatch.setattr(boss_catalog, "SessionLocal", sessionmaker(bind=sqlite_engine))
+    monkeypatch.setattr(boss_catalog, "load_boss_catalog", counting_load)
+    monkeypatch.setattr(boss_catalog, "_catalog", None)
+    return loads
+
+
+def _add_boss(db, boss_id):
+    db.add(models.Boss(boss_id=boss_id, name=f"Босс {boss_id}", base_lives=100, min_team_level=0))
+    db.commit()
+
+
+@pytest.mark.db
+def test_catalog_is_cached_until_invalidated(db, catalog_loads):
+    _add_boss(db, 1)
+    assert get_boss_catalog() is get_boss_catalog()
+    assert len(catalog_loads) == 1
+    
+    _add_boss(db, 2)
+    boss_catalog.invalidate_boss_catalog()
+    assert get_boss_catalog().get(2).boss_id == 2
+    assert len(catalog_loads) == 2
+
+
+@pytest.mark.db
+def test_empty_catalog_is_not_cached(db, catalog_loads):
+    assert len(get_boss_catalog()) == 0
+    
+    # Таблицу заполнили после первого обращения (init_bosses.py после старта воркера)
+    _add_boss(db, 1)
+    assert get_boss_catalog().for_level(10).boss_id == 1
+    assert len(catalog_loads) == 2
+
+
+@pytest.mark.db
+def test_unknown_boss_reloads_catalog_once(db, catalog_loads, monkeypatch):
+    _add_boss(db, 1)
+    get_boss_catalog()
+    # Босс добавлен на другом воркере, событие инвалидации потерялось
+    _add_boss(db, 2)
+    monkeypatch.setattr(boss_catalog, "BOSS_CATALOG_MISS_RELOAD_INTERVAL", 0)
+    
+    assert find_boss(2).boss_id == 2
+    assert len(catalog_loads) == 2
+    assert find_boss(1).boss_id == 1
+    assert len(catalog_loads) == 2
+
+
+@pytest.mark.db
+def test_missing_boss_reloads_are_rate_limited(db, catalog_loads):
+    _add_boss(db, 1)
+    get_boss_catalog()
+    
+    for _ in range(10):
+        assert find_boss(404) is None
+    # Только что загруженный каталог не перечитывается из-за промахов
+    assert len(catalog_loads) == 1
+
+
+@pytest.mark.db
+def test_catalog_expires_after_ttl(db, catalog_loads, monkeypatch):
+    _add_boss(db, 1)
+    get_boss_catalog()
+    _add_boss(db, 2)
+    assert get_boss_catalog().get(2) is None
+    
+    monkeypatch.setattr(boss_catalog, "BOSS_CATALOG_TTL", 0)
+    assert get_boss_catalog().get(2).boss_id == 2
+    assert len(catalog_loads) == 2
@@ -0,0 +1,88 @@
+"""Одновременные удары по боссу на реальном Postgres (TEST_DATABASE_URL)"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+from app.boss_catalog import load_boss_catalog
+from app.item_effects import invalidate_user_modifiers
+
+WORKERS = 16
+HITS_PER_WORKER = 25
+GOLD_REWARD = 150
+
+
+@pytest.fixture
+def team_with_boss(pg_db, monkeypatch):
+    # min_team_level не задан: после победы новый босс не назначается
+    boss = models.Boss(name="Гидра", base_lives=WORKERS * HITS_PER_WORKER, level=1, gold_reward=GOLD_REWARD)
+    members = [
+        models.User(login=f"member{index}", hashed_password="x", nickname=f"member{index}", gold=index)
+        for index in range(WORKERS)
+    ]
+    pg_db.add(boss)
+    pg_db.add_all(members)
+    pg_db.flush()
+    team = models.Team(
+        name="Стресс", owner_id=members[0].user_id, boss_id=boss.boss_id, boss_lives=boss.base_lives,
+        member_count=WORKERS, level_sum=WORKERS
+    )
+    pg_db.add(team)
+    pg_db.flush()
+    for member in members:
+        member.team_id = team.team_id
+    pg_db.commit()
+    
+    catalog = load_boss_catalog(pg_db)
+    monkeypatch.setattr(crud, "get_boss_catalog", lambda: catalog)
+    monkeypatch.setattr(crud, "find_boss", catalog.get)
+    for member in members:
+        invalidate_user_modifiers(member.user_id)
+    return team.team_id, boss.boss_id, {member.user_id: member.gold for member in members}
+
+
+@pytest.mark.postgres
+def test_concurrent_hits_are_not_lost_and_rewards_are_paid_once(pg_engine, team_with_boss):
+    team_id, boss_id, gold_before = team_with_boss
+    Session = sessionmaker(bind=pg_engine)
+    start = threading.Barrier(WORKERS)
+    finish = threading.Barrier(WORKERS)
+    
+    def worker():
+        db = Session()
+        hits = defeats = 0
+        try:
+            start.wait()
+            for _ in range(HITS_PER_WORKER):
+                hit = crud.damage_team_boss(db, team_id, 1)
+                db.commit()
+                if hit is None:
+                    continue
+                hits += 1
+                if hit.boss_lives == 0 and crud.defeat_boss(db, team_id, boss_id) is not None:
+                    defeats += 1
+            # Затем все участники одновременно пытаются забрать ту же победу
+            finish.wait()
+            if crud.defeat_boss(db, team_id, boss_id) is not None:
+                defeats += 1
+        finally:
+            db.close()
+        return hits, defeats
+    
+    with ThreadPoolExecutor(WORKERS) as pool:
+        results = list(pool.map(lambda _: worker(), range(WORKERS)))
+    
+    # Каждый удар уменьшил жизни ровно на 1, награду выдали один раз
+    assert sum(hits for hits, _ in results) == WORKERS * HITS_PER_WORKER
+    assert sum(defeats for _, defeats in results) == 1
+    
+    db = Session()
+    try:
+        team = db.get(models.Team, team_id)
+        assert (team.boss_id, team.boss_lives) == (None, 0)
+        gold_after = dict(db.query(models.User.user_id, models.User.gold).filter(models.User.team_id == team_id))
+        assert gold_after == {user_id: gold + GOLD_REWARD for user_id, gold in gold_before.items()}
+    finally:
+        db.close()
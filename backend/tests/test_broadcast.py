@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+from app.broadcast import MAX_NOTIFY_PAYLOAD, PostgresBroadcast, fit_notify_payload
+
+
+def test_small_event_is_sent_as_is():
+    event = {"team_id": 1, "event": {"type": "boss_hp", "boss_lives": 5}}
+    assert json.loads(fit_notify_payload(event)) == event
+
+
+def test_long_chat_text_is_truncated_to_fit():
+    event = {"team_id": 1, "event": {"type": "chat", "text": 'ж"' * 5000}}
+    payload = fit_notify_payload(event)
+    
+    assert len(payload.encode("utf-8")) <= MAX_NOTIFY_PAYLOAD
+    team_event = json.loads(payload)["event"]
+    assert team_event["truncated"] is True
+    assert event["event"]["text"].startswith(team_event["text"])
+
+
+def test_oversized_event_without_text_is_rejected():
+    event = {"team_id": 1, "event": {"type": "reward", "gold_by_user": {str(i): 100 for i in range(1000)}}}
+    assert fit_notify_payload(event) is None
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.notified = []
+        self._termination_listeners = []
+        self._listeners = []
+
+    def add_termination_listener(self, callback):
+        self._termination_listeners.append(callback)
+
+    async def add_listener(self, channel, callback):
+        self._listeners.append(callback)
+
+    async def remove_listener(self, channel, callback):
+        self._listeners.remove(callback)
+
+    async def execute(self, query, *args):
+        if self.closed:
+            raise ConnectionError("connection is closed")
+        if args:
+            self.notified.append(args[1])
+            for callback in self._listeners:
+                callback(self, 0, args[0], args[1])
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+    def terminate(self):
+        self.closed = True
+
+    def drop(self):
+        """Обрыв соединения со стороны сервера"""
+        self.closed = True
+        for callback in self._termination_listeners:
+            callback(self)
+
+
+class FakeBroadcast(PostgresBroadcast):
+    def __init__(self, failures=0):
+        super().__init__("postgresql://test", health_interval=0.05, max_reconnect_delay=0.1)
+        self.connections = []
+        self.failures = failures
+
+    async def _connect(self):
+        if self.connections and self.failures:
+            self.failures -= 1
+            raise OSError("connection refused")
+        self.connections.append(FakeConnection())
+        return self.connections[-1]
+
+
+def run_reconnect_scenario(failures):
+    async def scenario():
+        received = []
+        
+        async def handler(event):
+            received.append(event)
+        
+        broadcast = FakeBroadcast(failures)
+        await broadcast.connect(handler)
+        broadcast.connections[0].drop()
+        # Пока соединения нет, событие доставляется только локально
+        await asyncio.sleep(0.01)
+        await broadcast.publish({"team_id": 1, "event": {"type": "offline"}})
+        
+        for _ in range(100):
+            if broadcast._connection is not None and broadcast._connection is not broadcast.connections[0]:
+                break
+            await asyncio.sleep(0.05)
+        await broadcast.publish({"team_id": 1, "event": {"type": "online"}})
+        await asyncio.sleep(0)
+        await broadcast.disconnect()
+        return broadcast, received
+    
+    return asyncio.run(scenario())
+
+
+def test_reconnects_after_connection_is_lost(monkeypatch):
+    monkeypatch.setattr(asyncio, "sleep", _fast_sleep(asyncio.sleep))
+    broadcast, received = run_reconnect_scenario(failures=2)
+    
+    assert len(broadcast.connections) == 2
+    assert [event["event"]["type"] for event in received] == ["offline", "online"]
+    assert broadcast.connections[1].notified
+
+
+def _fast_sleep(sleep):
+    async def fast_sleep(delay, *args, **kwargs):
+        return await sleep(min(delay, 0.01), *args, **kwargs)
+    return fast_sleep
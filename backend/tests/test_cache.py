@@ -0,0 +1,59 @@
+import pytest
+
+from app import crud, models
+from app.cache import InvalidatedCache, RedisCache, TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+
+def test_invalidated_cache_notifies_listeners_on_delete_only():
+    cache = InvalidatedCache(TTLCache())
+    deleted = []
+    cache.invalidation_listeners.append(deleted.append)
+    cache.set("alice", {"gold": 10})
+    cache.delete_local("alice")
+    assert deleted == []
+    cache.set("alice", {"gold": 10})
+    cache.delete("alice")
+    assert deleted == ["alice"]
+    assert cache.get("alice") is None
+
+
+class _BrokenRedis:
+    def get(self, *args, **kwargs):
+        raise ConnectionError("redis is down")
+
+    set = delete = get
+
+
+def test_redis_cache_falls_back_to_miss_when_redis_is_down():
+    cache = RedisCache.__new__(RedisCache)
+    cache.ttl, cache.prefix = 30, "test:"
+    cache._client = _BrokenRedis()
+    cache._errors = (ConnectionError,)
+    assert cache.get("alice") is None
+    cache.set("alice", {"gold": 10})
+    cache.delete("alice")
+
+
+@pytest.mark.db
+def test_spend_user_gold_never_goes_negative(db):
+    user = models.User(login="buyer", hashed_password="x", nickname="buyer", gold=100)
+    db.add(user)
+    db.commit()
+
+    assert crud.spend_user_gold(db, user.user_id, 70) == 30
+    db.commit()
+    # Второе списание по устаревшему балансу (100 из кэша) не проходит
+    assert crud.spend_user_gold(db, user.user_id, 70) is None
+    db.commit()
+    db.refresh(user)
+    assert user.gold == 30
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from app import chat_buffer as chat_buffer_module
+from app.chat_buffer import ChatWriteBuffer
+
+
+class FakeSession:
+    """AsyncSessionLocal: запоминает вставленные строки, запись длится delay секунд"""
+
+    def __init__(self, saved, delay=0.0, fail=False):
+        self.saved = saved
+        self.delay = delay
+        self.fail = fail
+        self._rows = []
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        self._rows = []
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("database is unavailable")
+        params = statement.compile().params
+        self._rows = [value for key, value in params.items() if key.startswith("message")]
+
+    async def commit(self):
+        self.saved.extend(self._rows)
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    saved = []
+    monkeypatch.setattr(chat_buffer_module, "AsyncSessionLocal", FakeSession(saved, delay=0.05))
+    return saved
+
+
+def test_stop_waits_for_flush_in_progress(saved):
+    async def scenario():
+        buffer = ChatWriteBuffer(interval_ms=10, batch_size=100)
+        buffer.start()
+        buffer.add(1, 1, "первое")
+        # Останавливаем во время записи первой пачки
+        await asyncio.sleep(0.03)
+        buffer.add(1, 1, "второе")
+        await buffer.stop()
+        return buffer
+    
+    buffer = asyncio.run(scenario())
+    assert sorted(saved) == ["второе", "первое"]
+    assert buffer._pending == []
+
+
+def test_cancelled_flush_keeps_rows(saved):
+    async def scenario():
+        buffer = ChatWriteBuffer()
+        buffer.add(1, 1, "сообщение")
+        task = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return buffer
+    
+    buffer = asyncio.run(scenario())
+    assert saved == []
+    assert [row["message"] for row in buffer._pending] == ["сообщение"]
+
+
+def test_failed_flush_requeues_rows(monkeypatch):
+    monkeypatch.setattr(chat_buffer_module, "AsyncSessionLocal", FakeSession([], fail=True))
+    buffer = ChatWriteBuffer()
+    buffer.add(1, 1, "сообщение")
+    
+    assert asyncio.run(buffer.flush()) is False
+    assert len(buffer._pending) == 1
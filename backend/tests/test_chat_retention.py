@@ -0,0 +1,73 @@
+from datetime import date, datetime
+import os
+
+import pytest
+from sqlalchemy import text
+
+from app import chat_retention, models
+
+PARTITIONING_SQL = os.path.join(
+    os.path.dirname(__file__), "..", "migrations", "optional", "chat_messages_partitioning.sql"
+)
+
+
+def test_add_months_crosses_year_boundaries():
+    assert chat_retention._add_months(date(2026, 11, 18), 0) == date(2026, 11, 1)
+    assert chat_retention._add_months(date(2026, 11, 18), 3) == date(2027, 2, 1)
+    assert chat_retention._add_months(date(2026, 1, 31), -1) == date(2025, 12, 1)
+
+
+def test_partition_name():
+    assert chat_retention.partition_name(date(2026, 3, 1)) == "chat_messages_y2026m03"
+
+
+def _add_message(connection, message_id, timestamp):
+    connection.execute(text(
+        "INSERT INTO chat_messages (message_id, team_id, user_id, message, timestamp)"
+        " VALUES (:message_id, 1, 1, 'привет', :timestamp)"
+    ), {"message_id": message_id, "timestamp": timestamp})
+
+
+def _count(connection, table):
+    return connection.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+
+
+@pytest.mark.postgres
+def test_partitioning_keeps_legacy_rows_out_of_default_partition(pg_engine, monkeypatch):
+    monkeypatch.setattr(chat_retention, "engine", pg_engine)
+    today = date.today()
+    legacy_month = chat_retention._add_months(today, -14)
+    
+    with pg_engine.begin() as connection:
+        connection.execute(text("INSERT INTO users (user_id, login, hashed_password, nickname) VALUES (1, 'u', 'x', 'u')"))
+        connection.execute(text("INSERT INTO teams (team_id, name, owner_id) VALUES (1, 't', 1)"))
+        _add_message(connection, 1, datetime(legacy_month.year, legacy_month.month, 5))
+        _add_message(connection, 2, datetime.utcnow())
+    with open(PARTITIONING_SQL, encoding="utf-8") as script:
+        migration = script.read().replace("BEGIN;", "").replace("COMMIT;", "")
+    with pg_engine.begin() as connection:
+        # Без параметров: драйвер не разбирает % в format() миграции
+        connection.execution_options(no_parameters=True).exec_driver_sql(migration)
+    
+    with pg_engine.begin() as connection:
+        assert _count(connection, "chat_messages_default") == 0
+        assert _count(connection, chat_retention.partition_name(legacy_month)) == 1
+        # Строка за пределами созданных секций попадает в секцию по умолчанию
+        future = chat_retention._add_months(today, 6)
+        _add_message(connection, 3, datetime(future.year, future.month, 1))
+    
+    created = chat_retention.create_monthly_partitions(months_ahead=6)
+    assert created[-1] == chat_retention.partition_name(future)
+    with pg_engine.begin() as connection:
+        assert _count(connection, "chat_messages_default") == 0
+        assert _count(connection, chat_retention.partition_name(future)) == 1
+        # Старая строка в секции по умолчанию архивируется вместе с секциями
+        ancient = chat_retention._add_months(legacy_month, -24)
+        _add_message(connection, 4, datetime(ancient.year, ancient.month, 1))
+    
+    archived = chat_retention.archive_old_messages(older_than_months=6)
+    assert chat_retention.partition_name(legacy_month).replace("chat_messages_y", "chat_messages_archive_y") in archived
+    with pg_engine.begin() as connection:
+        assert _count(connection, "chat_messages_default") == 0
+        assert _count(connection, chat_retention.ARCHIVE_TABLE) == 1
+        assert _count(connection, "chat_messages") == 2
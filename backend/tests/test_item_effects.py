@@ -0,0 +1,49 @@
+import asyncio
+
+from app.item_effects import NO_MODIFIERS, ItemModifiers, calculate_rewards, compile_modifiers
+
+
+def test_compile_modifiers_without_bonuses():
+    assert compile_modifiers([]) is NO_MODIFIERS
+
+
+def test_compile_modifiers_sums_bonuses_of_same_type():
+    modifiers = compile_modifiers([("exp_multiplier", 5), ("exp_multiplier", 10), ("gold_multiplier", 5)])
+    assert modifiers.exp_bonus_percent == 15
+    assert modifiers.gold_bonus_percent == 5
+
+
+def test_compile_modifiers_ignores_one_shot_and_unknown_bonuses():
+    modifiers = compile_modifiers([("attack", 3), (None, None), ("double_gold_bosses", None)])
+    assert modifiers == ItemModifiers()
+
+
+def test_calculate_rewards_applies_class_and_item_bonuses():
+    modifiers = ItemModifiers(exp_bonus_percent=10, gold_bonus_percent=5)
+    # Класс 2 - +10% опыта, класс 3 - +10% золота
+    assert calculate_rewards(2, modifiers, 100, 100) == (105, 120)
+    assert calculate_rewards(3, modifiers, 100, 100) == (115, 110)
+
+
+def test_calculate_rewards_double_chance_always_triggers_at_100_percent():
+    modifiers = ItemModifiers(double_points_chance=100, double_gold_chance=100)
+    assert calculate_rewards(None, modifiers, 10, 20) == (20, 40)
+
+
+def test_modifiers_invalidation_reaches_other_workers(monkeypatch):
+    from app import main
+    from app.item_effects import invalidate_user_modifiers, modifiers_cache
+    
+    published = []
+    monkeypatch.setattr(main.broadcast, "publish_threadsafe", published.append)
+    modifiers_cache.set(42, ItemModifiers(gold_bonus_percent=10))
+    
+    invalidate_user_modifiers(42)
+    assert modifiers_cache.get(42) is None
+    assert published == [{"modifiers": 42}]
+    
+    # Другой воркер получает событие и сбрасывает свою копию без повторной рассылки
+    modifiers_cache.set(42, ItemModifiers(gold_bonus_percent=10))
+    asyncio.run(main.dispatch_broadcast(published[0]))
+    assert modifiers_cache.get(42) is None
+    assert published == [{"modifiers": 42}]
@@ -0,0 +1,64 @@
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app import main, metrics
+
+
+def _metric_lines(client, name):
+    return [line for line in client.get("/metrics").text.splitlines() if line.startswith(name)]
+
+
+def test_route_label_includes_router_prefix():
+    client = TestClient(main.app)
+    assert client.get("/api/users/me").status_code == 401
+    
+    assert 'http_requests_total{method="GET",route="/api/users/me",status="401"} 1' in \
+        "\n".join(_metric_lines(client, "http_requests_total"))
+
+
+def test_middleware_labels_templates_and_counts_errors():
+    router = APIRouter()
+    
+    @router.get("/widgets/{widget_id}")
+    def get_widget(widget_id: int):
+        return {"widget_id": widget_id}
+    
+    @router.get("/widgets/{widget_id}/explode")
+    def explode(widget_id: int):
+        raise RuntimeError("boom")
+    
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(router, prefix="/v1")
+    client = TestClient(app, raise_server_exceptions=False)
+    
+    for widget_id in (1, 2, 3):
+        assert client.get(f"/v1/widgets/{widget_id}").status_code == 200
+    assert client.get("/v1/widgets/1/explode").status_code == 500
+    assert client.get("/v1/missing").status_code == 404
+    
+    rendered = metrics.render_metrics()
+    assert 'http_requests_total{method="GET",route="/v1/widgets/{widget_id}",status="200"} 3' in rendered
+    assert 'http_request_errors_total{method="GET",route="/v1/widgets/{widget_id}/explode"} 1' in rendered
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in rendered
+    assert 'http_request_duration_seconds_count{method="GET",route="/v1/widgets/{widget_id}"} 3' in rendered
+    assert 'db_queries_per_request_bucket{route="/v1/widgets/{widget_id}",le="0"} 3' in rendered
+
+
+def test_pool_totals_are_counters():
+    rendered = metrics.render_metrics()
+    assert "# TYPE db_pool_checkout_timeouts_total counter" in rendered
+    assert "# TYPE db_pool_checkout_wait_seconds_total counter" in rendered
+    assert "# TYPE db_pool_connections gauge" in rendered
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_latency_seconds", "Test", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, ("/a",))
+    lines = list(histogram.render())
+    
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{route="/a"} 3' in lines
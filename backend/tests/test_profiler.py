@@ -0,0 +1,74 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, models, profiler
+from app.database import get_db
+from app.profiler import QueryProfile, assert_max_queries, normalize_statement
+
+
+def test_normalize_statement_replaces_literals_and_params():
+    assert normalize_statement(
+        "SELECT * FROM users WHERE login = 'it''s'  AND level > 10\n AND team_id = %(team_id_1)s"
+    ) == "SELECT * FROM users WHERE login = ? AND level > ? AND team_id = ?"
+    assert normalize_statement("SELECT 1 FROM tasks WHERE task_id = $1") == "SELECT ? FROM tasks WHERE task_id = ?"
+    assert normalize_statement("SELECT :value, CAST(x AS TEXT)::text") == "SELECT ?, CAST(x AS TEXT)::text"
+
+
+def test_normalize_statement_collapses_in_lists():
+    assert normalize_statement("SELECT * FROM tasks WHERE task_id IN (1, 2, 3)") == \
+        normalize_statement("SELECT * FROM tasks WHERE task_id IN (4)") == \
+        "SELECT * FROM tasks WHERE task_id IN (?)"
+
+
+def test_repeated_statements_flag_n_plus_one():
+    profile = QueryProfile()
+    for user_id in range(3):
+        profile.record(f"SELECT * FROM users WHERE user_id = {user_id}", 0.001)
+    profile.record("SELECT * FROM teams WHERE team_id = 1", 0.001)
+    
+    assert profile.count == 4
+    assert profile.repeated_statements(3) == [("SELECT * FROM users WHERE user_id = ?", 3)]
+
+
+def test_assert_max_queries_fails_on_extra_queries():
+    with pytest.raises(AssertionError, match="at most 1 queries, got 2"):
+        with assert_max_queries(1) as profile:
+            profile.record("SELECT 1", 0)
+            profile.record("SELECT 2", 0)
+
+
+@pytest.fixture
+def client(db):
+    user = models.User(login="planner", hashed_password="x", nickname="planner")
+    db.add(user)
+    db.flush()
+    catalog = models.Catalog(user_id=user.user_id, name="Неделя")
+    db.add(catalog)
+    db.flush()
+    for index in range(10):
+        task = models.Task(catalog_id=catalog.catalog_id, name=f"Задача {index}", complexity="easy")
+        db.add(task)
+        db.flush()
+        db.add_all([models.DailyTask(task_id=task.task_id, day_week=day) for day in ("mon", "fri")])
+    db.commit()
+    # Пользователь уже загружен, как после get_current_user
+    db.refresh(user)
+    
+    main.app.dependency_overrides[get_db] = lambda: db
+    main.app.dependency_overrides[main.get_current_active_user] = lambda: user
+    try:
+        yield TestClient(profiler.QueryProfilerMiddleware(main.app)), catalog.catalog_id
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+@pytest.mark.db
+def test_catalog_tasks_endpoint_query_budget(client):
+    client, catalog_id = client
+    response = client.get(f"/api/catalogs/{catalog_id}/tasks")
+    
+    assert response.status_code == 200
+    assert len(response.json()) == 10
+    # Каталог, задачи и расписания одним selectinload - не по запросу на задачу
+    assert int(response.headers["x-query-count"]) <= 3
+    assert "queries" in response.headers["server-timing"]
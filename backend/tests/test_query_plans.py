@@ -0,0 +1,92 @@
+"""Регрессия планов запросов crud на реальном Postgres (TEST_DATABASE_URL).
+
+Запросы, выполненные функциями crud, перехватываются и прогоняются через
+EXPLAIN с enable_seqscan = off: при этой настройке Postgres выбирает
+последовательное чтение, только если подходящего индекса нет, поэтому
+тест не зависит от объема данных в тестовой БД.
+"""
+from contextlib import contextmanager
+import re
+
+import pytest
+from sqlalchemy import event
+
+from app import crud, models
+from app.item_effects import get_users_modifiers, invalidate_user_modifiers
+
+# Таблицы, которые растут вместе с числом пользователей
+LARGE_TABLES = ("users", "catalogs", "tasks", "daily_task", "user_items", "chat_messages")
+
+_SEQ_SCAN_RE = re.compile(r"Seq Scan on (\w+)")
+
+
+@contextmanager
+def capture_selects(engine):
+    statements = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+    
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def seq_scans(engine, statement, parameters):
+    with engine.connect() as connection:
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = connection.exec_driver_sql("EXPLAIN " + statement, parameters).scalars().all()
+    return [table for line in plan for table in _SEQ_SCAN_RE.findall(line) if table in LARGE_TABLES]
+
+
+@pytest.fixture
+def seeded(pg_db):
+    owner = models.User(login="owner", hashed_password="x", nickname="owner")
+    pg_db.add(owner)
+    pg_db.flush()
+    team = models.Team(name="Команда", owner_id=owner.user_id, member_count=1, level_sum=1)
+    pg_db.add(team)
+    pg_db.flush()
+    owner.team_id = team.team_id
+    item = models.Item(name="Амулет", price=10, type="com", bonus_type="gold_multiplier", bonus_data=5)
+    catalog = models.Catalog(user_id=owner.user_id, name="Дела")
+    pg_db.add_all([item, catalog])
+    pg_db.flush()
+    task = models.Task(catalog_id=catalog.catalog_id, name="Зарядка", complexity="easy")
+    pg_db.add_all([
+        task,
+        models.UserItem(user_id=owner.user_id, item_id=item.item_id, active="true"),
+        models.ChatMessage(team_id=team.team_id, user_id=owner.user_id, message="Привет"),
+    ])
+    pg_db.flush()
+    pg_db.add(models.DailyTask(task_id=task.task_id, day_week="mon"))
+    pg_db.commit()
+    invalidate_user_modifiers(owner.user_id)
+    return owner.user_id, team.team_id, catalog.catalog_id
+
+
+@pytest.mark.postgres
+def test_crud_queries_do_not_scan_large_tables(pg_engine, pg_db, seeded):
+    user_id, team_id, catalog_id = seeded
+    with capture_selects(pg_engine) as statements:
+        crud.get_user_catalogs(pg_db, user_id)
+        crud.get_tasks_with_daily_schedule(pg_db, catalog_id)
+        crud.get_tasks_with_daily_schedule(pg_db, catalog_id, after_id=0)
+        crud.get_daily_tasks_for_user_today(pg_db, user_id)
+        crud.get_team_members(pg_db, team_id)
+        crud.get_user_items(pg_db, user_id)
+        crud.get_active_items_count(pg_db, user_id)
+        crud.get_team_chat_messages(pg_db, team_id)
+        crud.get_team_chat_messages(pg_db, team_id, before=10 ** 6)
+        get_users_modifiers(pg_db, [user_id])
+    
+    assert statements
+    failures = {}
+    for statement, parameters in statements:
+        tables = seq_scans(pg_engine, statement, parameters)
+        if tables:
+            failures[statement] = tables
+    assert not failures, failures
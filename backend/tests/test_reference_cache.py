@@ -0,0 +1,108 @@
+import json
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from app import main, models, reference_cache as reference_cache_module
+from app.reference_cache import ReferenceDataCache
+
+
+def _request(if_none_match=None):
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_response_slices_one_cached_list():
+    cache = ReferenceDataCache()
+    calls = []
+    
+    def loader():
+        calls.append(1)
+        return [{"id": index} for index in range(10)]
+    
+    first = cache.response(_request(), "items", loader, 2, 3)
+    second = cache.response(_request(), "items", loader, 0, 100)
+    
+    assert json.loads(first.body) == [{"id": 2}, {"id": 3}, {"id": 4}]
+    assert len(json.loads(second.body)) == 10
+    assert first.headers["etag"] != second.headers["etag"]
+    assert len(calls) == 1
+    assert list(cache._entries) == ["items"]
+
+
+def test_not_modified_for_matching_etag():
+    cache = ReferenceDataCache()
+    loader = lambda: [{"id": 1}]
+    etag = cache.response(_request(), "classes", loader, 0, 100).headers["etag"]
+    
+    assert cache.response(_request(f"W/{etag}"), "classes", loader, 0, 100).status_code == 304
+    assert cache.response(_request(etag), "classes", loader, 1, 100).status_code == 200
+
+
+def test_invalidate_reloads_and_changes_etag():
+    cache = ReferenceDataCache()
+    rows = [{"id": 1}]
+    hooks = []
+    cache.on_invalidate("bosses", lambda: hooks.append(1))
+    etag = cache.response(_request(), "bosses", lambda: list(rows)).headers["etag"]
+    
+    rows.append({"id": 2})
+    cache.invalidate("bosses")
+    response = cache.response(_request(etag), "bosses", lambda: list(rows))
+    
+    assert response.status_code == 200
+    assert len(json.loads(response.body)) == 2
+    assert hooks == [1]
+
+
+def test_load_does_not_block_other_kinds_and_stale_load_is_dropped():
+    cache = ReferenceDataCache()
+    loading = threading.Event()
+    release = threading.Event()
+    
+    def slow_loader():
+        loading.set()
+        release.wait(5)
+        return [{"version": "old"}]
+    
+    thread = threading.Thread(target=cache.get, args=("items", slow_loader))
+    thread.start()
+    assert loading.wait(5)
+    # Медленная загрузка предметов не задерживает классы
+    assert cache.get("classes", lambda: [{"id": 1}]).rows == (b'{"id":1}',)
+    cache.invalidate("items")
+    release.set()
+    thread.join(5)
+    
+    # Загрузка, начатая до invalidate(), в кэш не попала
+    assert cache.get("items", lambda: [{"version": "new"}]).rows == (b'{"version":"new"}',)
+
+
+@pytest.fixture
+def client(sqlite_engine, db, monkeypatch):
+    db.add(models.Class(class_id=1, name="Воин", information="Сильный"))
+    db.add_all([
+        models.Item(item_id=index, name=f"Предмет {index}", price=10 * index, type="com", class_id=1)
+        for index in range(1, 4)
+    ])
+    db.commit()
+    monkeypatch.setattr(main, "SessionLocal", sessionmaker(bind=sqlite_engine))
+    monkeypatch.setattr(reference_cache_module.reference_cache, "_entries", {})
+    return TestClient(main.app)
+
+
+@pytest.mark.db
+def test_items_and_classes_endpoints(client):
+    items = client.get("/api/items", params={"skip": 1, "limit": 5})
+    classes = client.get("/api/classes/")
+    
+    assert items.status_code == 200
+    assert [item["item_id"] for item in items.json()] == [2, 3]
+    assert items.json()[0]["class_info"] == {"name": "Воин", "information": "Сильный", "class_id": 1}
+    assert classes.json() == [{"name": "Воин", "information": "Сильный", "class_id": 1}]
+    
+    cached = client.get("/api/items", params={"skip": 1, "limit": 5}, headers={"If-None-Match": items.headers["etag"]})
+    assert cached.status_code == 304
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, models, security
+from app.database import get_async_db
+
+PASSWORD_HASH = security.get_password_hash("secret")
+
+
+async def _no_db():
+    yield None
+
+
+@pytest.fixture
+def client(monkeypatch):
+    user = models.User(user_id=1, login="hero", nickname="hero", hashed_password=PASSWORD_HASH)
+    
+    async def get_user_by_login(db, login):
+        return user if login == user.login else None
+    
+    monkeypatch.setattr(main.async_crud, "get_user_by_login", get_user_by_login)
+    main.app.dependency_overrides[get_async_db] = _no_db
+    try:
+        yield TestClient(main.app)
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+def _fill_password_slots():
+    taken = 0
+    while security._password_slots.acquire(blocking=False):
+        taken += 1
+    return taken
+
+
+def _release_password_slots(taken):
+    for _ in range(taken):
+        security._password_slots.release()
+
+
+def test_login_returns_token(client):
+    response = client.post("/api/auth/token", data={"username": "hero", "password": "secret"})
+    assert response.status_code == 200
+    assert response.json()["token_type"] == "bearer"
+    
+    response = client.post("/api/auth/token", data={"username": "hero", "password": "wrong"})
+    assert response.status_code == 401
+
+
+def test_login_returns_503_when_hasher_is_saturated(client):
+    taken = _fill_password_slots()
+    try:
+        response = client.post("/api/auth/token", data={"username": "hero", "password": "secret"})
+    finally:
+        _release_password_slots(taken)
+    
+    assert taken == security.PASSWORD_HASH_WORKERS + security.PASSWORD_HASH_QUEUE_LIMIT
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(security.PASSWORD_HASH_RETRY_AFTER)
+
+
+def test_password_slots_are_released_after_jobs():
+    async def verify_many():
+        return await asyncio.gather(*(
+            security.verify_password_async("secret", PASSWORD_HASH) for _ in range(security.PASSWORD_HASH_WORKERS)
+        ))
+    
+    assert all(asyncio.run(verify_many()))
+    taken = _fill_password_slots()
+    _release_password_slots(taken)
+    assert taken == security.PASSWORD_HASH_WORKERS + security.PASSWORD_HASH_QUEUE_LIMIT
@@ -0,0 +1,94 @@
+"""Экземпляры ежедневных задач по датам: generate_series и to_char выполняются только в Postgres"""
+from datetime import date
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, main, models
+
+
+@pytest.fixture
+def schedule(pg_db):
+    owner = models.User(login="planner", hashed_password="x", nickname="planner")
+    stranger = models.User(login="stranger", hashed_password="x", nickname="stranger")
+    pg_db.add_all([owner, stranger])
+    pg_db.flush()
+    catalog = models.Catalog(user_id=owner.user_id, name="Неделя")
+    foreign_catalog = models.Catalog(user_id=stranger.user_id, name="Чужое")
+    pg_db.add_all([catalog, foreign_catalog])
+    pg_db.flush()
+    workout = models.Task(catalog_id=catalog.catalog_id, name="Зарядка", complexity="easy")
+    cleaning = models.Task(catalog_id=catalog.catalog_id, name="Уборка", complexity="hard")
+    foreign = models.Task(catalog_id=foreign_catalog.catalog_id, name="Чужая", complexity="easy")
+    pg_db.add_all([workout, cleaning, foreign])
+    pg_db.flush()
+    pg_db.add_all([
+        models.DailyTask(task_id=workout.task_id, day_week="mon"),
+        models.DailyTask(task_id=workout.task_id, day_week="thu"),
+        models.DailyTask(task_id=cleaning.task_id, day_week="sun"),
+        models.DailyTask(task_id=foreign.task_id, day_week="mon"),
+    ])
+    pg_db.commit()
+    return owner, workout.task_id, cleaning.task_id
+
+
+@pytest.fixture
+def client(pg_engine, schedule, monkeypatch):
+    monkeypatch.setattr(main, "SessionLocal", sessionmaker(bind=pg_engine))
+    main.app.dependency_overrides[main.get_current_active_user] = lambda: schedule[0]
+    try:
+        yield TestClient(main.app)
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+@pytest.mark.postgres
+@pytest.mark.parametrize("batch_size", [500, 1])
+def test_instances_across_week_boundary(client, schedule, monkeypatch, batch_size):
+    _, workout_id, cleaning_id = schedule
+    iter_instances = crud.iter_daily_task_instances
+    monkeypatch.setattr(
+        crud, "iter_daily_task_instances",
+        lambda *args, **kwargs: iter_instances(*args, **{**kwargs, "batch_size": batch_size})
+    )
+    
+    # Четверг 22.10.2026 - вторник 27.10.2026
+    response = client.get("/api/tasks/instances", params={"from": "2026-10-22", "to": "2026-10-27"})
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/json")
+    instances = json.loads(response.text)
+    assert [(item["date"], item["task_id"]) for item in instances] == [
+        ("2026-10-22", workout_id),
+        ("2026-10-25", cleaning_id),
+        ("2026-10-26", workout_id),
+    ]
+    assert instances[0] == {
+        "task_id": workout_id,
+        "instance_id": f"{workout_id}_2026-10-22",
+        "name": "Зарядка",
+        "complexity": "easy",
+        "completed": False,
+        "date": "2026-10-22",
+        "is_daily_instance": True,
+        "original_task_id": workout_id,
+    }
+    assert all(date.fromisoformat(item["date"]).strftime("%a").lower() in ("mon", "thu", "sun") for item in instances)
+
+
+@pytest.mark.postgres
+def test_empty_range_is_an_empty_array(client):
+    response = client.get("/api/tasks/instances", params={"from": "2026-10-20", "to": "2026-10-21"})
+    assert response.text == "[]"
+
+
+def test_range_validation(monkeypatch):
+    main.app.dependency_overrides[main.get_current_active_user] = lambda: models.User(user_id=1)
+    try:
+        client = TestClient(main.app)
+        assert client.get("/api/tasks/instances", params={"from": "2026-10-22", "to": "2026-10-21"}).status_code == 400
+        assert client.get("/api/tasks/instances", params={"from": "2026-01-01", "to": "2027-01-02"}).status_code == 400
+    finally:
+        main.app.dependency_overrides.clear()
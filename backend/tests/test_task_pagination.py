@@ -0,0 +1,53 @@
+import pytest
+
+from app import crud, models
+from app.profiler import assert_max_queries
+
+
+@pytest.fixture
+def catalog_id(db):
+    user = models.User(login="planner", hashed_password="x", nickname="planner")
+    db.add(user)
+    db.flush()
+    catalog = models.Catalog(user_id=user.user_id, name="Неделя")
+    db.add(catalog)
+    db.flush()
+    for index in range(7):
+        task = models.Task(catalog_id=catalog.catalog_id, name=f"Задача {index}", complexity="easy")
+        db.add(task)
+        db.flush()
+        db.add(models.DailyTask(task_id=task.task_id, day_week="mon"))
+    db.commit()
+    return catalog.catalog_id
+
+
+@pytest.mark.db
+def test_offset_pagination(db, catalog_id):
+    all_ids = [task.task_id for task in crud.get_tasks_with_daily_schedule(db, catalog_id)]
+    assert all_ids == sorted(all_ids) and len(all_ids) == 7
+    
+    page = crud.get_tasks_with_daily_schedule(db, catalog_id, skip=2, limit=3)
+    assert [task.task_id for task in page] == all_ids[2:5]
+
+
+@pytest.mark.db
+def test_cursor_pagination(db, catalog_id):
+    all_ids = [task.task_id for task in crud.get_tasks_with_daily_schedule(db, catalog_id)]
+    
+    pages = []
+    after_id = None
+    while True:
+        page = crud.get_tasks_with_daily_schedule(db, catalog_id, limit=3, after_id=after_id)
+        if not page:
+            break
+        pages.append([task.task_id for task in page])
+        after_id = page[-1].task_id
+    assert pages == [all_ids[0:3], all_ids[3:6], all_ids[6:7]]
+
+
+@pytest.mark.db
+def test_schedules_are_loaded_in_one_extra_query(db, catalog_id):
+    db.expire_all()
+    with assert_max_queries(2):
+        tasks = crud.get_tasks_with_daily_schedule(db, catalog_id)
+        assert all(task.daily_tasks[0].day_week == "mon" for task in tasks)
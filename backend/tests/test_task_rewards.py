@@ -0,0 +1,98 @@
+from datetime import date
+
+import pytest
+
+from app import crud, models
+from app.item_effects import invalidate_user_modifiers
+from app.profiler import assert_max_queries
+
+
+@pytest.mark.parametrize("level, points, max_points, expected", [
+    (1, 50, 100, (1, 50, 100, 0)),
+    (1, 100, 100, (2, 0, 200, 1)),
+    (1, 150, 100, (2, 50, 200, 1)),
+    # 100 + 200 + 300 = 600 опыта на три уровня
+    (1, 650, 100, (4, 50, 400, 3)),
+    (5, 499, 500, (5, 499, 500, 0)),
+])
+def test_calculate_level_up(level, points, max_points, expected):
+    assert crud.calculate_level_up(level, points, max_points) == expected
+
+
+def test_calculate_level_up_matches_step_by_step_loop():
+    for points in range(0, 5000, 37):
+        level, rest, max_points, gained = 3, points, 300, 0
+        while rest >= max_points:
+            rest -= max_points
+            level += 1
+            gained += 1
+            max_points = 100 * level
+        assert crud.calculate_level_up(3, points, 300) == (level, rest, max_points, gained)
+
+
+@pytest.fixture
+def task(db):
+    user = models.User(login="hero", hashed_password="x", nickname="hero", points=90, max_points=100)
+    db.add(user)
+    db.flush()
+    catalog = models.Catalog(user_id=user.user_id, name="Дела")
+    db.add(catalog)
+    db.flush()
+    task = models.Task(catalog_id=catalog.catalog_id, name="Зарядка", complexity="easy", completed="false")
+    db.add(task)
+    db.commit()
+    invalidate_user_modifiers(user.user_id)
+    yield task
+    invalidate_user_modifiers(user.user_id)
+
+
+@pytest.mark.db
+def test_update_task_completion_query_count(db, task):
+    user_id = task.catalog.user_id
+    # Задача, награда с повышением уровня и чтение результата - без чтения строки пользователя
+    with assert_max_queries(5):
+        result = crud.update_task_completion(db, task.task_id, "true", user_id, gold_change=10, points_change=20)
+    assert result.completed == "true"
+    
+    user = db.get(models.User, user_id)
+    db.refresh(user)
+    assert (user.gold, user.level, user.points, user.max_points, user.attack) == (10, 2, 10, 200, 2)
+
+
+@pytest.mark.db
+def test_update_task_completion_rewards_only_once(db, task):
+    user_id = task.catalog.user_id
+    crud.update_task_completion(db, task.task_id, "true", user_id, gold_change=10, points_change=5)
+    with assert_max_queries(3):
+        crud.update_task_completion(db, task.task_id, "true", user_id, gold_change=10, points_change=5)
+    # Снятие отметки и повторная отметка тоже не платят второй раз
+    crud.update_task_completion(db, task.task_id, "false", user_id)
+    result = crud.update_task_completion(db, task.task_id, "true", user_id, gold_change=10, points_change=5)
+    
+    assert result.completed == "true"
+    user = db.get(models.User, user_id)
+    db.refresh(user)
+    assert (user.gold, user.points) == (10, 95)
+
+
+@pytest.mark.db
+def test_daily_task_is_rewarded_once_per_day(db, task):
+    user_id = task.catalog.user_id
+    db.add(models.DailyTask(task_id=task.task_id, day_week="mon"))
+    db.commit()
+    monday, tuesday = date(2026, 10, 19), date(2026, 10, 20)
+    
+    # Двойной клик в один день
+    for _ in range(2):
+        crud.update_task_completion(db, task.task_id, "true", user_id, gold_change=10, today=monday)
+    crud.update_task_completion(db, task.task_id, "false", user_id, today=monday)
+    crud.update_task_completion(db, task.task_id, "true", user_id, gold_change=10, today=monday)
+    user = db.get(models.User, user_id)
+    db.refresh(user)
+    assert user.gold == 10
+    
+    # На следующий день задачу можно выполнить снова
+    crud.update_task_completion(db, task.task_id, "true", user_id, gold_change=10, today=tuesday)
+    crud.update_task_completion(db, task.task_id, "true", user_id, gold_change=10, today=tuesday)
+    db.refresh(user)
+    assert user.gold == 20
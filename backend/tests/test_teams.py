@@ -0,0 +1,50 @@
+import pytest
+
+from app import crud, models
+from app.boss_catalog import BossCatalog, BossInfo
+
+
+@pytest.fixture
+def events():
+    events = []
+    
+    def listener(team_id, event):
+        events.append((team_id, event))
+    
+    crud.team_event_listeners.append(listener)
+    yield events
+    crud.team_event_listeners.remove(listener)
+
+
+@pytest.fixture
+def boss(db, monkeypatch):
+    db.add(models.Boss(boss_id=1, name="Слизень", base_lives=50, level=1, gold_reward=100, min_team_level=0))
+    db.commit()
+    catalog = BossCatalog([BossInfo(1, "Слизень", 50, None, 1, 100, None, 0)])
+    monkeypatch.setattr(crud, "get_boss_catalog", lambda: catalog)
+    return catalog.get(1)
+
+
+@pytest.mark.db
+def test_second_member_joins_and_gets_boss(db, boss, events):
+    owner = models.User(login="owner", hashed_password="x", nickname="owner", level=3)
+    newcomer = models.User(login="newcomer", hashed_password="x", nickname="newcomer", level=5)
+    db.add_all([owner, newcomer])
+    db.flush()
+    team = models.Team(name="Отряд", owner_id=owner.user_id, member_count=1, level_sum=3)
+    db.add(team)
+    db.flush()
+    owner.team_id = team.team_id
+    db.commit()
+    
+    user = crud.add_member_to_team(db, team.team_id, newcomer.user_id)
+    
+    assert user.team_id == team.team_id
+    db.refresh(team)
+    assert (team.member_count, team.level_sum) == (2, 8)
+    assert (team.boss_id, team.boss_lives) == (boss.boss_id, boss.base_lives)
+    
+    assert [event["type"] for _, event in events] == ["boss", "member"]
+    assert events[-1] == (team.team_id, {
+        "type": "member", "user_id": newcomer.user_id, "nickname": "newcomer", "level": 5, "attack": 1, "img": None
+    })
@@ -0,0 +1,156 @@
+"""Открытые WebSocket чата не держат соединений с БД"""
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import main, models, security
+from app.cache import identity_cache
+from app.database import async_engine, engine, to_async_url
+from app.websocket_manager import team_manager
+
+IDLE_SOCKETS = 500
+TEAM_ID = 1
+
+
+def _make_user():
+    return models.User(
+        user_id=1, login="chatter", nickname="chatter", level=1, lives=10, max_lives=10,
+        points=0, max_points=100, gold=0, attack=1, team_id=TEAM_ID
+    )
+
+
+def _checked_out():
+    return engine.pool.checkedout() + async_engine.sync_engine.pool.checkedout()
+
+
+async def _open_socket(path: str, accepted: asyncio.Event, release: asyncio.Event, sent: list):
+    connected = False
+    
+    async def receive():
+        nonlocal connected
+        if not connected:
+            connected = True
+            return {"type": "websocket.connect"}
+        await release.wait()
+        return {"type": "websocket.disconnect", "code": 1000}
+    
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "websocket.accept":
+            accepted.set()
+    
+    scope = {
+        "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "path": path,
+        "raw_path": path.encode(), "query_string": b"", "headers": [], "root_path": "",
+        "client": ("test", 0), "server": ("test", 80), "subprotocols": [],
+    }
+    await main.app(scope, receive, send)
+
+
+async def _idle_sockets(login: str, checked_out, team_id: int = TEAM_ID):
+    """Открыть IDLE_SOCKETS сокетов; число открытых и checked_out(), пока они простаивают"""
+    path = f"/api/ws/team-chat/{team_id}/{security.create_access_token(subject=login)}"
+    release = asyncio.Event()
+    accepted = [asyncio.Event() for _ in range(IDLE_SOCKETS)]
+    sent = [[] for _ in range(IDLE_SOCKETS)]
+    sockets = [
+        asyncio.create_task(_open_socket(path, accepted[index], release, sent[index]))
+        for index in range(IDLE_SOCKETS)
+    ]
+    await asyncio.wait_for(asyncio.gather(*(event.wait() for event in accepted)), 30)
+    
+    open_sockets = len(team_manager.active_connections.get(team_id, {}))
+    idle_checked_out = checked_out()
+    
+    release.set()
+    await asyncio.wait_for(asyncio.gather(*sockets), 30)
+    return open_sockets, idle_checked_out
+
+
+class CountingSessions:
+    """Фабрика сессий вместо AsyncSessionLocal: считает открытые сессии (взятые соединения)"""
+
+    def __init__(self):
+        self.opened = 0
+        self.open = 0
+        self.max_open = 0
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        self.opened += 1
+        self.open += 1
+        self.max_open = max(self.max_open, self.open)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.open -= 1
+
+
+def test_idle_sockets_hold_no_db_connections(monkeypatch):
+    user = _make_user()
+    sessions = CountingSessions()
+    lookups = []
+    
+    async def get_user_by_login(db, login: str):
+        # Пользователь ищется внутри открытой сессии, а не из кэша
+        assert db is sessions and sessions.open > 0
+        lookups.append(login)
+        await asyncio.sleep(0)
+        return user
+    
+    identity_cache.delete_local(user.login)
+    monkeypatch.setattr(main, "AsyncSessionLocal", sessions)
+    monkeypatch.setattr(main.async_crud, "get_user_by_login", get_user_by_login)
+    # Каждый сокет идет по пути промаха кэша
+    monkeypatch.setattr(identity_cache, "set", lambda key, value: None)
+    
+    open_sockets, idle_sessions = asyncio.run(_idle_sockets(user.login, lambda: sessions.open + _checked_out()))
+    
+    assert open_sockets == IDLE_SOCKETS
+    assert len(lookups) == sessions.opened == IDLE_SOCKETS
+    assert sessions.max_open > 0
+    assert idle_sessions == 0
+    assert TEAM_ID not in team_manager.active_connections
+
+
+@pytest.mark.postgres
+def test_idle_sockets_return_pool_connections_on_postgres(pg_engine, pg_db, monkeypatch):
+    user = models.User(login="chatter", hashed_password="x", nickname="chatter")
+    pg_db.add(user)
+    pg_db.flush()
+    team = models.Team(name="Чат", owner_id=user.user_id, member_count=1, level_sum=1)
+    pg_db.add(team)
+    pg_db.flush()
+    user.team_id = team.team_id
+    pg_db.commit()
+    
+    identity_cache.delete_local(user.login)
+    monkeypatch.setattr(identity_cache, "set", lambda key, value: None)
+    
+    async def scenario():
+        test_engine = create_async_engine(
+            to_async_url(pg_engine.url.render_as_string(hide_password=False)), pool_size=5, max_overflow=0
+        )
+        checkouts = []
+        event.listen(test_engine.sync_engine, "checkout", lambda *args: checkouts.append(1))
+        monkeypatch.setattr(main, "AsyncSessionLocal", sessionmaker(
+            bind=test_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+        ))
+        try:
+            result = await _idle_sockets(user.login, test_engine.sync_engine.pool.checkedout, team.team_id)
+        finally:
+            await test_engine.dispose()
+        return result, len(checkouts)
+    
+    (open_sockets, idle_checked_out), checkouts = asyncio.run(scenario())
+    
+    assert open_sockets == IDLE_SOCKETS
+    # Пул из 5 соединений обслужил все 500 входов и вернул их, пока сокеты открыты
+    assert checkouts >= IDLE_SOCKETS
+    assert idle_checked_out == 0
+    assert team.team_id not in team_manager.active_connections
@@ -0,0 +1,116 @@
+"""Рассылка в чат команды: очередь на сокет, отбрасывание старых событий, отключение медленных"""
+import asyncio
+import json
+
+from app import websocket_manager, ws_protocol
+from app.websocket_manager import TeamConnection, TeamConnectionManager
+
+TEAM_ID = 1
+
+
+class FakeSocket:
+    def __init__(self, stalled: bool = False):
+        self.received = []
+        self.close_code = None
+        self.gate = asyncio.Event()
+        if not stalled:
+            self.gate.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame: str):
+        await self.gate.wait()
+        payload = json.loads(frame)
+        self.received.extend(payload["events"] if payload["type"] == ws_protocol.EVENT_BATCH else [payload])
+
+    async def close(self, code: int):
+        self.close_code = code
+
+
+def _chat(number: int) -> dict:
+    return {"team_id": TEAM_ID, "event": ws_protocol.chat_event(1, "boss", str(number))}
+
+
+def _small_queues(monkeypatch):
+    monkeypatch.setattr(websocket_manager, "WS_SEND_QUEUE_SIZE", 10)
+    monkeypatch.setattr(websocket_manager, "WS_MAX_DROPPED_MESSAGES", 20)
+    monkeypatch.setattr(websocket_manager, "WS_BATCH_WINDOW_MS", 0)
+
+
+def test_stalled_sockets_are_dropped_without_delaying_fast_ones(monkeypatch):
+    _small_queues(monkeypatch)
+    events = 60
+    
+    async def scenario():
+        manager = TeamConnectionManager()
+        fast = [FakeSocket() for _ in range(1000)]
+        stalled = [FakeSocket(stalled=True) for _ in range(3)]
+        for websocket in fast + stalled:
+            await manager.connect(websocket, TEAM_ID)
+        
+        for number in range(events):
+            await manager.deliver_local(_chat(number))
+            # Быстрые писатели успевают отправить событие до следующего
+            for _ in range(3):
+                await asyncio.sleep(0)
+        
+        connections = manager.active_connections[TEAM_ID]
+        for websocket in stalled:
+            assert websocket not in connections
+            assert websocket.close_code == 1013
+        for websocket in fast:
+            assert websocket in connections
+            assert [event["text"] for event in websocket.received] == [str(number) for number in range(events)]
+            assert connections[websocket].dropped == 0
+        
+        for websocket in fast:
+            manager.disconnect(websocket, TEAM_ID)
+        for websocket in stalled:
+            websocket.gate.set()
+    
+    asyncio.run(scenario())
+
+
+def test_client_that_catches_up_is_not_dropped(monkeypatch):
+    _small_queues(monkeypatch)
+    
+    async def scenario():
+        websocket = FakeSocket(stalled=True)
+        connection = TeamConnection(websocket)
+        connection.start()
+        sent = 0
+        
+        # Каждый раз клиент теряет почти предельное число событий, но затем догоняет:
+        # за все время потерь больше лимита, а подряд - нет
+        for _ in range(5):
+            websocket.gate.clear()
+            for _ in range(1 + websocket_manager.WS_SEND_QUEUE_SIZE + websocket_manager.WS_MAX_DROPPED_MESSAGES):
+                assert connection.enqueue(ws_protocol.chat_event(1, "boss", str(sent)))
+                sent += 1
+                await asyncio.sleep(0)
+            assert connection.dropped == websocket_manager.WS_MAX_DROPPED_MESSAGES
+            
+            websocket.gate.set()
+            while not connection.queue.empty():
+                await asyncio.sleep(0)
+            await asyncio.sleep(0)
+        
+        # При переполнении теряются самые старые события: последние всегда доставлены
+        texts = [event["text"] for event in websocket.received]
+        assert texts[-websocket_manager.WS_SEND_QUEUE_SIZE:] == [
+            str(number) for number in range(sent - websocket_manager.WS_SEND_QUEUE_SIZE, sent)
+        ]
+        assert len(texts) < sent
+        
+        websocket.gate.clear()
+        results = []
+        for _ in range(2 + websocket_manager.WS_SEND_QUEUE_SIZE + websocket_manager.WS_MAX_DROPPED_MESSAGES):
+            results.append(connection.enqueue(ws_protocol.chat_event(1, "boss", "late")))
+            await asyncio.sleep(0)
+        assert results[-1] is False
+        assert results.count(False) == 1
+        
+        connection.stop()
+    
+    asyncio.run(scenario())
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from app import ws_protocol
+
+
+def test_single_event_is_sent_without_batch_envelope():
+    event = ws_protocol.make_event(ws_protocol.EVENT_BOSS_HP, boss_id=1, boss_lives=5)
+    assert json.loads(ws_protocol.encode_frame([event])) == {"v": 1, "type": "boss_hp", "boss_id": 1, "boss_lives": 5}
+
+
+def test_several_events_are_batched():
+    events = [ws_protocol.chat_event(1, "hero", "привет"), ws_protocol.envelope({"type": "member_left", "user_id": 2})]
+    frame = ws_protocol.encode_frame(events)
+    
+    assert "привет" in frame
+    assert json.loads(frame) == {"v": 1, "type": "batch", "events": events}
+
+
+def test_negotiate_format_falls_back_to_json(monkeypatch):
+    monkeypatch.setattr(ws_protocol, "msgpack", None)
+    assert ws_protocol.negotiate_format("msgpack") == ws_protocol.FORMAT_JSON
+    assert ws_protocol.negotiate_format(None) == ws_protocol.FORMAT_JSON
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("привет", "привет"),
+    ('{"type": "chat", "text": "из конверта"}', "из конверта"),
+    ('{"type": "ping"}', None),
+    ('{"type": "chat", "text": 5}', None),
+    # Текст, похожий на JSON, но не конверт, остается сообщением
+    ("{не json", "{не json"),
+    ('{"text": "без типа"}', '{"text": "без типа"}'),
+])
+def test_decode_chat_text(text, expected):
+    assert ws_protocol.decode_chat_text(text) == expected
+
+
+def test_binary_frames_need_msgpack(monkeypatch):
+    monkeypatch.setattr(ws_protocol, "msgpack", None)
+    assert ws_protocol.decode_chat_text(data=b"\x81") is None
+
+
+def test_msgpack_round_trip():
+    msgpack = pytest.importorskip("msgpack")
+    event = ws_protocol.chat_event(1, "hero", "привет")
+    assert msgpack.unpackb(ws_protocol.encode_frame([event], ws_protocol.FORMAT_MSGPACK), raw=False) == event
+    assert ws_protocol.decode_chat_text(data=msgpack.packb({"type": "chat", "text": "бинарный"})) == "бинарный"
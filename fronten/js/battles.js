@@ -233,16 +233,18 @@ async function checkUserTeamStatus() {
       return;
     }
 
-    const response = await fetch(`${window.API_BASE_URL}/teams/my-team`, {
+    // Достаточно team_id пользователя: полная команда (/teams/my-team) здесь не нужна
+    const response = await fetch(`${window.API_BASE_URL}/users/me`, {
       headers: { "Authorization": `Bearer ${token}` }
     });
+    const user = response.ok ? await response.json() : null;
 
-    if (response.ok) {
+    if (user && user.team_id) {
       // ИСПРАВЛЕНИЕ: Автоматический редирект если пользователь уже в команде
       console.log('User is already in a team, redirecting to team.html');
       window.location.href = 'team.html';
       return;
-    } else if (response.status === 404) {
+    } else if (user) {
       // Пользователь не в команде - показываем интерфейс battles.html
       const teamNavSection = document.querySelector('.team-nav-section');
       if (teamNavSection) {
@@ -9,6 +9,8 @@ const WS_BASE_URL = `${WS_PROTOCOL}://${window.location.host}${window.API_BASE_U
 let currentTeam = null;
 let currentUser = null;
 let chatWebSocket = null;
+// Участники команды, у которых открыта страница команды
+let onlineMembers = new Set();
 let memberToRemove = null;
 
 // Инициализация страницы
@@ -188,7 +190,8 @@ function displayTeamMembers() {
     
     const memberSpan = document.createElement('span');
     memberSpan.className = 'members' + (member.user_id === currentTeam.owner_id ? ' owner' : '');
-    memberSpan.textContent = member.nickname + (member.user_id === currentTeam.owner_id ? ' (владелец)' : '');
+    memberSpan.textContent = (onlineMembers.has(member.user_id) ? '● ' : '') + member.nickname
+      + (member.user_id === currentTeam.owner_id ? ' (владелец)' : '');
     memberSpan.style.cursor = 'pointer';
     memberSpan.onclick = () => viewMemberProfile(member.user_id);
     li.appendChild(memberSpan);
@@ -305,7 +308,11 @@ function connectToChat() {
   };
   
   chatWebSocket.onmessage = function(event) {
-    addMessageToChat(event.data);
+    const teamEvent = parseTeamEvent(event.data);
+    if (!teamEvent) return;
+    // Сервер может прислать несколько событий одним кадром
+    const events = teamEvent.type === 'batch' ? teamEvent.events : [teamEvent];
+    events.forEach(handleTeamEvent);
   };
   
   chatWebSocket.onclose = function() {
@@ -323,6 +330,83 @@ function connectToChat() {
   };
 }
 
+// Версия протокола событий командного сокета (см. backend/app/ws_protocol.py)
+const TEAM_PROTOCOL_VERSION = 1;
+
+// События команды приходят как JSON-конверт {v, type, ...}
+function parseTeamEvent(data) {
+  if (typeof data !== 'string') return null;
+  try {
+    const parsed = JSON.parse(data);
+    if (!parsed || typeof parsed.type !== 'string' || parsed.v > TEAM_PROTOCOL_VERSION) return null;
+    return parsed;
+  } catch (e) {
+    return null;
+  }
+}
+
+function handleTeamEvent(teamEvent) {
+  if (!currentTeam) return;
+  
+  if (teamEvent.type === 'chat') {
+    addMessageToChat(`${teamEvent.nickname}: ${teamEvent.text}`);
+  } else if (teamEvent.type === 'reward') {
+    const gold = teamEvent.gold_by_user[currentUser?.user_id];
+    if (gold) {
+      addMessageToChat(`Босс повержен! Вы получили ${gold} золота`);
+    }
+  } else if (teamEvent.type === 'boss_hp') {
+    // Здоровье прежнего босса после смены игнорируем: новый придет событием boss
+    if (teamEvent.boss_id !== currentTeam.boss_id) return;
+    currentTeam.boss_lives = teamEvent.boss_lives;
+    displayBossInfo();
+  } else if (teamEvent.type === 'boss') {
+    currentTeam.boss_id = teamEvent.boss_id;
+    currentTeam.boss = teamEvent.boss;
+    currentTeam.boss_lives = teamEvent.boss_lives;
+    displayBossInfo();
+  } else if (teamEvent.type === 'boss_defeated') {
+    addMessageToChat('Босс повержен!');
+  } else if (teamEvent.type === 'member') {
+    applyMemberDiff(teamEvent);
+  } else if (teamEvent.type === 'member_left') {
+    if (teamEvent.user_id === currentUser?.user_id) {
+      // Нас удалили из команды
+      currentTeam = null;
+      if (chatWebSocket) chatWebSocket.close();
+      showNoTeamMessage();
+      return;
+    }
+    currentTeam.members = (currentTeam.members || []).filter(member => member.user_id !== teamEvent.user_id);
+    onlineMembers.delete(teamEvent.user_id);
+    displayTeamMembers();
+    displayBossInfo();
+  } else if (teamEvent.type === 'presence') {
+    if (Array.isArray(teamEvent.online)) {
+      onlineMembers = new Set(teamEvent.online);
+    } else if (teamEvent.online) {
+      onlineMembers.add(teamEvent.user_id);
+    } else {
+      onlineMembers.delete(teamEvent.user_id);
+    }
+    displayTeamMembers();
+  }
+}
+
+// Изменение участника приходит как diff: только изменившиеся поля
+function applyMemberDiff(diff) {
+  const { v, type, team_id, ...fields } = diff;
+  currentTeam.members = currentTeam.members || [];
+  const member = currentTeam.members.find(m => m.user_id === fields.user_id);
+  if (member) {
+    Object.assign(member, fields);
+  } else if (fields.nickname) {
+    currentTeam.members.push(fields);
+  }
+  displayTeamMembers();
+  displayBossInfo();
+}
+
 // Загрузка истории чата
 async function loadChatHistory() {
   if (!currentTeam) {
@@ -380,7 +464,7 @@ function sendMessage() {
   const message = input.value.trim();
   
   if (message && chatWebSocket && chatWebSocket.readyState === WebSocket.OPEN) {
-    chatWebSocket.send(message);
+    chatWebSocket.send(JSON.stringify({ v: TEAM_PROTOCOL_VERSION, type: 'chat', text: message }));
     input.value = '';
   } else if (message) {
     console.error('Cannot send message: WebSocket not connected');